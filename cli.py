@@ -1,10 +1,22 @@
-from plotting_test.plotter import main
 from argparse import ArgumentParser
+from datetime import datetime
 import os
 
+def parse_time(s):
+	return datetime.strptime(s, '%Y-%m-%d %H:%M:%S')
+
 parser = ArgumentParser()
 parser.add_argument("-i", "--instr", action="store_true", default=False, help="run cli in instrument mode")
 parser.add_argument("-r", "--reupload", help="run cli in reupload mode, needs filepath")
+parser.add_argument("-t", "--transport", choices=['batch', 'ring', 'queue'], default='batch', help="how instrument readings reach the plotter")
+parser.add_argument("--ingest", choices=['coalesce', 'drop_oldest', 'block'], default='coalesce', help="what the plotter does with readings it can't keep up with")
+parser.add_argument("--raw", choices=['csv', 'binary'], default='csv', help="format of the raw serial capture (rawraw_data.csv or the compact rawraw_data.bin)")
+parser.add_argument("-s", "--speed", type=float, default=1.0, help="replay speed in reupload and test mode, as a multiple of real time (0 = as fast as possible)")
+parser.add_argument("--start", type=parse_time, help="in reupload and test mode, replay from this time of the recording (YYYY-mm-dd HH:MM:SS)")
+parser.add_argument("--end", type=parse_time, help="in reupload and test mode, stop replaying at this time of the recording (YYYY-mm-dd HH:MM:SS)")
+parser.add_argument("-b", "--batch", help="analyse a recorded raw_data.csv without the GUI, as fast as it can be read")
+parser.add_argument("-o", "--out", help="in batch mode, directory to write the results to (a new csv_outputs/ session by default)")
+parser.add_argument("-d", "--devices", help="in instrument mode, find serial devices in this directory instead of /dev (e.g. sim_farm.py's)")
 
 args = vars(parser.parse_args())
 
@@ -12,5 +24,12 @@ if args['reupload']:
 	args['reupload'] = os.path.abspath(args['reupload'])
 
 if __name__ == '__main__':
-    main(instr=args['instr'], reupload=args['reupload'])
+    if args['batch']:
+        # no wx - runs on a server without a display
+        from plotting_test.analysis import batch
+        out = os.path.join(os.path.abspath(args['out']), '') if args['out'] else None
+        batch(os.path.abspath(args['batch']), out)
+    else:
+        from plotting_test.plotter import main
+        main(instr=args['instr'], reupload=args['reupload'], transport=args['transport'], devices=args['devices'], ingest_policy=args['ingest'], raw_format=args['raw'], speed=args['speed'], start=args['start'], end=args['end'])
 
@@ -0,0 +1,642 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import _strptime
+import os
+import errno
+import sys
+import time
+import hashlib
+import collections
+import csv
+import math
+from datetime import datetime
+import numpy as np
+import replay_cache as cache
+import replay_engine as eng
+import rolling_stats as rs
+import second_store as ss
+import timebase as tb
+
+# default pip values (channel, instrument, start lag, stop lag)
+DEFAULT_PIP = [
+    ('BC', 'ABCD', -3, 20),
+    ('BC', 'AE16', 1, 6),
+    ('BC', 'AE33', 1, 12),
+    ('BC', 'MA300', 1, 28),
+    ('CO2', 'K30', 0, 7),
+    ('CO2', 'LI7000', 0, 2),
+    ('CO2', 'LI820', 0, 3),
+    ('CO2', 'Vaisala', 6, 25), # add +8 to start (ie. -2, 25)
+    ('NOX', 'CAPS', -2, 3),
+    ('NOX', 'UCB', -1, 3),
+    # factor out - just for testing
+    ('NOX', 'CLD64', 2, 0),
+    ('CO2', 'SBA5', 0, 0),
+    ]
+
+# emission factor of each species, for a plume's area relative to the primary co2 area
+EMISSION_FACTORS = {'CO2': 3190.0, 'NOX': 3335.0, 'BC': 1.778}
+
+# interval (seconds) of the plotter's analysis frames - batch mode steps the analysis by the same frames
+FRAME = 0.2
+
+# analysis stages and the age (seconds) a second reaches them at
+STAGES = (('guessed', 30), ('deblipped', 35), ('ended', 45), ('evicted', 185))
+# age (seconds) a second is written to secondly_data.csv at
+FLUSH = 5
+
+# new csv_outputs/<hash>/ directory under the working directory
+def session_dir():
+    h = hashlib.sha1()
+    h.update(str(time.time()))
+    return os.getcwd() + '/csv_outputs/' + h.hexdigest()[:10] + '/'
+
+# plume detection and the plume/secondly output files, without any of the GUI
+#
+# readings go in through align_ts, and every frame analyze(now) and write_ts(now) move the
+# analysis horizons on to NOW (epoch ns) - the plotter's AnalysisWorker does this in its own
+# thread, batch() as fast as a recorded session can be read. writes plume_events.csv, plumes.csv,
+# secondly_data.csv and instruments.csv to FILEPATH.
+class PlumeAnalyzer(object):
+    def __init__(self, instruments, filepath):
+        self.instruments = instruments
+        self.co2_instr = [x for x in self.instruments if x.v_type == 'CO2']
+        self.bc_instr = [x for x in self.instruments if x.v_type == 'BC']
+        self.nox_instr = [x for x in self.instruments if x.v_type == 'NOX']
+        self.co2_chans = len(self.co2_instr)
+        self.bc_chans = len(self.bc_instr)
+        self.nox_chans = len(self.nox_instr)
+
+        self.co2_chan_names = {}
+        self.bc_chan_names = {}
+        self.nox_chan_names = {}
+        for i, x in enumerate(self.co2_instr):
+            self.co2_chan_names[x.name] = i
+        for i, x in enumerate(self.nox_instr):
+            self.nox_chan_names[x.name] = i
+        for i, x in enumerate(self.bc_instr):
+            self.bc_chan_names[x.name] = i
+
+        # set channel_units
+        self.chan_units = {'CO2':'ppm', 'NOX':'ppm', 'BC':'µg/m3'}
+
+        # set neighbor threshold and slope threshold
+        self.neighbor_threshold = 50
+        self.slope_threshold = 50
+
+        # set plume counter
+        self.plume_counter = 1
+
+        # plume collecting dict
+        self.plumes = {'CO2':{}, 'NOX':{}, 'BC':{}}
+        for i in range(self.co2_chans):
+            self.plumes['CO2'][i] = []
+        for i in range(self.nox_chans):
+            self.plumes['NOX'][i] = []
+        for i in range(self.bc_chans):
+            self.plumes['BC'][i] = []
+
+        # readings by second
+        self.store = ss.SecondStore({'CO2': self.co2_chans, 'NOX': self.nox_chans, 'BC': self.bc_chans})
+        # primary co2 around the second being guessed
+        self.window = rs.RollingWindow()
+        # stage -> last second the analysis stage has passed, -1 until the first frame
+        self.marks = dict((stage, -1) for stage, age in STAGES)
+        # last second written to secondly_data.csv
+        self.flushed = -1
+        # seconds that got their first reading after analyze / write_ts had passed them
+        self.late = set()
+        self.late_flush = set()
+
+        # time correction
+        self.pip = {'CO2':{},'NOX':{},'BC':{}}
+        for i in range(self.co2_chans):
+            self.pip['CO2'][i] = {'start_lag':None, 'stop_lag':None}
+        for i in range(self.nox_chans):
+            self.pip['NOX'][i] = {'start_lag':None, 'stop_lag':None}
+        for i in range(self.bc_chans):
+            self.pip['BC'][i] = {'start_lag':None, 'stop_lag':None}
+
+        # setup with default pip values
+        for pip in DEFAULT_PIP:
+            self.set_pip_by_chan(*pip)
+
+        # set primary co2 instrument
+        self.primary_co2instr = self.getIdByName('LI7000', 'CO2')
+
+        # create and write headers of output files
+        self.filepath = filepath
+
+        if not os.path.exists(os.path.dirname(self.filepath)):
+            try:
+                os.makedirs(os.path.dirname(self.filepath))
+            except OSError as exc: # Guard against race condition
+                if exc.errno != errno.EEXIST:
+                    raise
+
+        self.plumefile = self.filepath + 'plume_events.csv'
+        self.plumeArea = self.filepath + 'plumes.csv'
+        self.summaryfile = self.filepath + 'secondly_data.csv'
+        self.instrumentfile = self.filepath + 'instruments.csv'
+        with open(self.plumefile, mode='wb') as plumeFile:
+            self.plumeData = csv.writer(plumeFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            self.plumeData.writerow(['plume_raw_start_time', 'plume_raw_stop_time', 'plume_event_id', 'detector_instrument_id', 'detector_instrument_model'])
+        with open(self.plumeArea, mode='wb') as plumeArea:
+            self.plumeAreas = csv.writer(plumeArea, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            self.plumeAreas.writerow(['plume_event_id', 'instrument_id', 'instrument_model', 'channel_species', 'channel_units', 'pip_pre', 'pip_post', 'plume_start_time', 'plume_stop_time', 'baseline_pre', 'baseline_post', 'baseline_area', 'plume_total_area', 'plume_area', 'emission_factor'])
+        with open(self.instrumentfile, mode='wb') as instrFile:
+            self.instrumentWriter = csv.writer(instrFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            self.instrumentWriter.writerow(['Instr ID', 'Channel'])
+            for i in self.co2_instr:
+                self.instrumentWriter.writerow([i.name, 'CO2'])
+            for i in self.nox_instr:
+                self.instrumentWriter.writerow([i.name, 'NOX'])
+            for i in self.bc_instr:
+                self.instrumentWriter.writerow([i.name, 'BC'])
+        # secondly_data.csv header is written on the first frame, after the startup instruments
+        self.setSummary = True
+
+    # CURRENT_TIME in epoch nanoseconds, the store's seconds are int epoch seconds
+    #
+    # each stage keeps a watermark, the last second it has passed: guessing at 30 s old, deblipping
+    # at 35 s, the plume end check at 45 s and eviction at 185 s. a frame only looks at the seconds
+    # held that crossed a stage's horizon since the last one (and any that got their first reading
+    # after being passed), in order, so its cost follows the new data rather than the seconds kept.
+    # a frame that fails leaves the watermarks at the last second it got through.
+    def analyze(self, current_time):
+        store = self.store
+        if store.first is None:
+            return
+        current_s = current_time / 1e9
+        # stage -> (watermark before the frame, second now past its horizon)
+        horizons = {}
+        todo = set(self.late)
+        for stage, age in STAGES:
+            mark = self.marks[stage]
+            last = tb.floor_s(current_time - age * tb.NS)
+            horizons[stage] = (mark, last)
+            todo.update(store.seconds(max(mark + 1, store.first), last)[0].tolist())
+        for k in sorted(todo):
+            self.analyze_second(k, current_s, current_time, horizons['ended'])
+            self.late.discard(k)
+            for stage, (mark, last) in horizons.items():
+                if k <= last:
+                    self.marks[stage] = max(k, self.marks[stage])
+        for stage, (mark, last) in horizons.items():
+            self.marks[stage] = max(last, self.marks[stage])
+
+    # the stages due for second K, ENDED the plume end check's (previous watermark, horizon)
+    def analyze_second(self, k, current_s, current_time, ended):
+        store = self.store
+        if k not in store:
+            return
+        if (k - 30) > store.first:
+            diff = current_s - k
+            if diff >= 185:
+                store.evict(k)
+                return
+            # plume analyze, once the second is past 45 s
+            if ended[0] < k <= ended[1]:
+                if store.plume(k) == True and not store.flag(k, ss.ANALYZED) and store.plume(k + 1) == False:
+                    store.set_flag(k, ss.ANALYZED)
+                    print('found plume ending at {}'.format(tb.to_datetime(k * tb.NS)))
+                    self.plume_calc(k, current_time)
+            # deblipping
+            if diff >= 35 and not store.flag(k, ss.BLIP):
+                store.set_flag(k, ss.BLIP)
+                if store.plume(k) == True:
+                    if store.plume(k + 1) == False and store.plume(k - 1) == False:
+                        store.set_plume(k, False)
+                    elif store.plume(k + 1) == False and store.plume(k - 2) == False:
+                        assert store.plume(k - 1) == True
+                        store.set_plume(k, False)
+                        store.set_flag(k - 1, ss.BLIP)
+                        store.set_plume(k - 1, False)
+                    elif store.plume(k - 1) == False and store.plume(k + 2) == False:
+                        assert store.plume(k + 1) == True
+                        store.set_plume(k, False)
+                        store.set_flag(k + 1, ss.BLIP)
+                        store.set_plume(k + 1, False)
+            # initial guessing and calc
+            if diff >= 30:
+                if store.plume(k) == None:
+                    co2_val = self.lvcf(k, 'CO2', self.primary_co2instr)
+                    deriv = self.lvcf(k + 1, 'CO2', self.primary_co2instr) - co2_val
+                    mean, sd, quan = self.calc_window(k)
+                    # decision tree
+                    if abs(deriv) > self.slope_threshold:
+                        store.set_plume(k, True)
+                        ret = True
+                        method = 'deriv > slope_thres'
+                    elif mean is not None and co2_val > (mean + (sd * 3)):
+                        store.set_plume(k, True)
+                        ret = True
+                        method = 'co2_val > (mean + 3 * sd)'
+                    elif quan is not None and (co2_val - quan) > self.neighbor_threshold:
+                        store.set_plume(k, True)
+                        ret = True
+                        method = 'co2_val - quan > neighbor_thres'
+                    else:
+                        store.set_plume(k, False)
+                        ret = False
+                    # factor out - testing
+                    print('guessing: {}'.format(ret))
+                    if ret == True:
+                        print('found by {}'.format(method))
+        else:
+            store.set_plume(k, False)
+
+    # plumes.csv rows for the plume ending at STOP_TIME, for every channel at once
+    #
+    # the channels' last values over the plume and its baselines come from the store as one
+    # (channel, second) matrix. each channel's baselines are the 3 s before its pip-corrected start
+    # and after its stop, its total area the trapezoid over the plume's seconds, and the emission
+    # factors are relative to the primary co2 channel's area (the first row)
+    def plume_calc(self, stop_time, current_time):
+        start_time, event_id = self.write_plume_event(stop_time)
+        chans = [('CO2', self.primary_co2instr)]
+        chans += [('CO2', i) for i in range(self.co2_chans) if i != self.primary_co2instr]
+        chans += [('NOX', i) for i in range(self.nox_chans)]
+        chans += [('BC', i) for i in range(self.bc_chans)]
+        # channels without pip values can't be placed
+        chans = [(s, i) for s, i in chans if None not in (self.pip[s][i]['start_lag'], self.pip[s][i]['stop_lag'])]
+        pip_pre = np.array([self.pip[s][i]['start_lag'] for s, i in chans])
+        pip_post = np.array([self.pip[s][i]['stop_lag'] for s, i in chans])
+        plume_start = start_time - pip_pre
+        plume_stop = stop_time + pip_post
+
+        first = min(plume_start.min() - 3, start_time)
+        last = max(plume_stop.max() + 3, stop_time)
+        blocks = dict((s, self.store.last_range(first, last, s)[0]) for s in ss.SPECIES)
+        values = np.array([blocks[s][:, i] for s, i in chans])
+        rows = np.arange(len(chans))
+        start_col = plume_start - first
+        stop_col = plume_stop - first
+        baseline_pre = (values[rows, start_col - 1] + values[rows, start_col - 2] + values[rows, start_col - 3]) / 3
+        baseline_post = (values[rows, stop_col + 1] + values[rows, stop_col + 2] + values[rows, stop_col + 3]) / 3
+        baseline_area = (plume_stop - plume_start) * (baseline_pre + baseline_post) / 2.0
+        # latest second first, the order the areas have always been summed in
+        plume = np.ascontiguousarray(values[:, start_time - first:stop_time - first + 1][:, ::-1])
+        plume_total_area = ((plume[:, 1:] + plume[:, :-1]) / 2.0).sum(axis=1)
+        plume_area = plume_total_area - baseline_area
+        factors = np.array([EMISSION_FACTORS[s] for s, i in chans])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            emission_factor = factors * (plume_area / plume_area[0])
+        emission_factor[0] = EMISSION_FACTORS['CO2']
+
+        out = []
+        columns = [baseline_pre, baseline_post, baseline_area, plume_total_area, plume_area, emission_factor]
+        columns = [[None if math.isnan(v) else v for v in c.tolist()] for c in columns]
+        for row, (species, i) in enumerate(chans):
+            model = self.getNameById(i, species)
+            out.append([event_id, self.getSerialbyName(model, species), model, species, self.chan_units[species],
+                self.pip[species][i]['start_lag'], self.pip[species][i]['stop_lag'],
+                tb.to_datetime(int(plume_start[row]) * tb.NS), tb.to_datetime(int(plume_stop[row]) * tb.NS)] + [c[row] for c in columns])
+            self.plumes[species][i].append([int(plume_start[row]), int(plume_stop[row])])
+        with open(self.plumeArea, mode='ab') as plumeArea:
+            writer = csv.writer(plumeArea, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerows(out)
+
+    # (mean, variance, 3rd lowest) of the primary co2 seconds from 30 s before SECOND to 30 s after
+    # - seconds without a reading are left out, None if there are too few
+    def calc_window(self, second):
+        self.window.slide(second - 30, second + 30, self.window_value)
+        return self.window.mean(), self.window.variance(), self.window.lowest(2)
+
+    def window_value(self, second):
+        if second not in self.store:
+            return None
+        return self.store.mean(second, 'CO2', self.primary_co2instr)
+
+    # returns None if CHAN/NAME has no value at or before TIMESTAMP
+    def lvcf(self, timestamp, chan, name):
+        return self.store.last(timestamp, chan, name)[0]
+
+    def getIdByName(self, name, chan):
+        if chan == 'CO2':
+            for k, v in self.co2_chan_names.items():
+                if k == name:
+                    return v
+        elif chan == 'NOX':
+            for k, v in self.nox_chan_names.items():
+                if k == name:
+                    return v
+        elif chan == 'BC':
+            for k, v in self.bc_chan_names.items():
+                if k == name:
+                    return v
+        return None
+
+    def getNameById(self, ID, chan):
+        if chan == 'CO2':
+            for k, v in self.co2_chan_names.items():
+                if v == ID:
+                    return k
+        elif chan == 'NOX':
+            for k, v in self.nox_chan_names.items():
+                if v == ID:
+                    return k
+        elif chan == 'BC':
+            for k, v in self.bc_chan_names.items():
+                if v == ID:
+                    return k
+        return None
+
+    def getSerialbyName(self, name, chan):
+        if chan == 'CO2':
+            for instr in self.co2_instr:
+                if instr.name == name and hasattr(instr, 'serial_num'):
+                    return instr.serial_num
+        elif chan == 'NOX':
+            for instr in self.nox_instr:
+                if instr.name == name and hasattr(instr, 'serial_num'):
+                    return instr.serial_num
+        elif chan == 'BC':
+            for instr in self.nox_instr:
+                if instr.name == name and hasattr(instr, 'serial_num'):
+                    return instr.serial_num
+        return None
+
+    def write_plume_event(self, stop_time):
+        s = 1
+        start_time = None
+        while start_time is None:
+            t = stop_time - s
+            if self.store.plume(t) == False:
+                assert s >= 2
+                start_time = t + 1
+            s += 1
+        event_id = float(start_time)
+        detector_instr_model = self.getNameById(self.primary_co2instr, 'CO2')
+        detector_instr_id = self.getSerialbyName(detector_instr_model, 'CO2')
+
+        to_write = [tb.to_datetime(start_time * tb.NS), tb.to_datetime(stop_time * tb.NS), event_id, detector_instr_id, detector_instr_model]
+        with open(self.plumefile, mode='ab') as plumeFile:
+            writer = csv.writer(plumeFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow(to_write)
+
+        return start_time, event_id
+
+    def write_ts(self, current_time):
+        csv_post = []
+        store = self.store
+        last = tb.floor_s(current_time - FLUSH * tb.NS)
+        seconds = []
+        if store.first is not None:
+            # the seconds past FLUSH s since the last frame, and late ones written out of order
+            held, flags = store.seconds(max(self.flushed + 1, store.first), last)
+            seconds = held[(flags & ss.WRITTEN) == 0].tolist()
+            seconds += sorted(k for k in self.late_flush if k in store and not store.flag(k, ss.WRITTEN))
+            self.late_flush = set()
+            self.flushed = max(last, self.flushed)
+        for k in seconds:
+            self.store.set_flag(k, ss.WRITTEN)
+            csv_post.append([tb.to_datetime(k * tb.NS)] + self.store.row(k))
+        with open(self.summaryfile, mode='ab') as summaryFile:
+                writer = csv.writer(summaryFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                writer.writerows(csv_post)
+
+    # add an instrument INSTR that started reporting while running - returns its channel index, or
+    # None if it is known already (an instrument that was unplugged and comes back keeps its channel)
+    def add_instrument(self, instr):
+        species = instr.v_type
+        key = species.lower()
+        names = getattr(self, key + '_chan_names')
+        if instr.name in names:
+            return None
+        idx = len(names)
+        names[instr.name] = idx
+        self.instruments.append(instr)
+        getattr(self, key + '_instr').append(instr)
+        setattr(self, key + '_chans', idx + 1)
+        self.plumes[species][idx] = []
+        self.pip[species][idx] = {'start_lag':None, 'stop_lag':None}
+        for pip in DEFAULT_PIP:
+            if pip[0] == species and pip[1] == instr.name:
+                self.set_pip_by_chan(*pip)
+        self.store.add_channel(species)
+        if species == 'CO2' and self.primary_co2instr is None:
+            self.primary_co2instr = self.getIdByName('LI7000', 'CO2')
+            self.window.clear()
+
+        with open(self.instrumentfile, mode='ab') as instrFile:
+            writer = csv.writer(instrFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerow([instr.name, species])
+        # rows written from here on have the extra column - start a new header block
+        if not self.setSummary:
+            self.setupSummary(mode='ab')
+        return idx
+
+    # Input Structure (timestamp in epoch nanoseconds):
+    # (['AE33-1-BC-nan', 'BC'], [0.1895, 1570560146206925000])
+    # added to the store's int epoch second 1570560146, channel of AE33-1-BC-nan in 'BC'
+    def align_ts(self, dp, dp_type):
+        chan = self.getIdByName(dp[0][0], dp[0][1])
+        if chan is None:
+            raise KeyError(dp[0][0])
+        second = tb.floor_s(dp[1][1])
+        if self.store.add(second, dp_type, chan, dp[1][0]):
+            # a new second the watermarks have already passed
+            if second <= self.marks['guessed']:
+                self.late.add(second)
+            if second <= self.flushed:
+                self.late_flush.add(second)
+        if dp_type == 'CO2' and chan == self.primary_co2instr:
+            self.window.update(second, self.window_value(second))
+
+    def correct_ts(self, timestamps, chan, instr_id):
+        start_lag = self.pip[chan][instr_id]['start_lag']
+        stop_lag = self.pip[chan][instr_id]['stop_lag']
+        return [timestamps[0] - start_lag, timestamps[1] + stop_lag]
+
+    def setupSummary(self, mode='wb'):
+        with open(self.summaryfile, mode=mode) as summaryFile:
+            self.summary = csv.writer(summaryFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            header = ['Timestamp']
+            co2_names = dict((v,k) for k,v in self.co2_chan_names.iteritems())
+            nox_names = dict((v,k) for k,v in self.nox_chan_names.iteritems())
+            bc_names = dict((v,k) for k,v in self.bc_chan_names.iteritems())
+            for i in range(self.co2_chans):
+                header.append(co2_names[i])
+            for i in range(self.nox_chans):
+                header.append(nox_names[i])
+            for i in range(self.bc_chans):
+                header.append(bc_names[i])
+            self.summary.writerow(header)
+        self.setSummary = False
+
+    def set_pip_by_chan(self, chan, name, start_lag, stop_lag):
+        if chan == 'CO2':
+            try:
+                name_id = self.co2_chan_names[name]
+            except KeyError:
+                return
+        elif chan == 'NOX':
+            try:
+                name_id = self.nox_chan_names[name]
+            except KeyError:
+                return
+        elif chan == 'BC':
+            try:
+                name_id = self.bc_chan_names[name]
+            except KeyError:
+                return
+        self.pip[chan][name_id]['start_lag'] = start_lag
+        self.pip[chan][name_id]['stop_lag'] = stop_lag
+
+# instruments of a recorded session - from the instruments.csv next to RAW_PATH, or in the order
+# they first report in raw_data.csv RAW_PATH if there is none
+def session_instruments(raw_path):
+    instruments = []
+    instr_path = os.path.join(os.path.dirname(raw_path), 'instruments.csv')
+    if os.path.exists(instr_path):
+        with open(instr_path) as instr_file:
+            instr_reader = csv.reader(instr_file, delimiter=',')
+            next(instr_reader)
+            for row in instr_reader:
+                instruments.append(eng.Instrument(row[0], row[1]))
+        return instruments
+    seen = set()
+    with open(raw_path) as raw_file:
+        raw_reader = csv.reader(raw_file, delimiter=',')
+        next(raw_reader)
+        for row in raw_reader:
+            if (row[1], row[2]) not in seen:
+                seen.add((row[1], row[2]))
+                instruments.append(eng.Instrument(row[1], row[2]))
+    return instruments
+
+# raw_data.csv timestamp - str(datetime) leaves out the microseconds when they are 0
+def parse_timestamp(s):
+    try:
+        return tb.from_datetime(datetime.strptime(s, '%Y-%m-%d %H:%M:%S.%f'))
+    except ValueError:
+        return tb.from_datetime(datetime.strptime(s, '%Y-%m-%d %H:%M:%S'))
+
+# raw_data.csv value - the int 0 the senders put in for a missing reading stays an int, so the
+# averages come out the same as they did live
+def parse_value(s):
+    try:
+        return int(s)
+    except ValueError:
+        pass
+    try:
+        return float(s)
+    except ValueError:
+        return 0
+
+# (epoch ns, name, v_type, value) readings of recorded session RAW_PATH (a raw_data.csv) stamped
+# from datetime START to END, in the order they were written
+def raw_readings(raw_path, start=None, end=None):
+    start_ns = tb.from_datetime(start) if start is not None else None
+    end_ns = tb.from_datetime(end) if end is not None else None
+    with open(raw_path) as raw_file:
+        raw_file.readline()
+        if start is not None:
+            cache.seek(raw_file, raw_path, cache.recording_ns(start))
+        raw_reader = csv.reader(raw_file, delimiter=',')
+        for row in raw_reader:
+            ts = parse_timestamp(row[0])
+            if start_ns is not None and ts < start_ns:
+                continue
+            if end_ns is not None and ts >= end_ns:
+                # rows are written in arrival order - a few more can still be before END
+                if ts >= end_ns + cache.MINUTE:
+                    return
+                continue
+            yield ts, row[1], row[2], parse_value(row[3])
+
+# (Instrument, path) for the campaign files (replay_engine.CAMPAIGN_FILES) in DIRECTORY
+def campaign_instruments(directory):
+    files = []
+    for f, v_type, skip in eng.CAMPAIGN_FILES:
+        path = os.path.join(directory, f)
+        if os.path.exists(path):
+            files.append((eng.Instrument(f.split('-')[0], v_type), path))
+    return files
+
+# readings of the campaign in DIRECTORY (a plume_results/<campaign>) from datetime START to END,
+# merged by their recorded time - missing readings are 0 as replay sends them
+def campaign_readings(directory, start=None, end=None):
+    files = campaign_instruments(directory)
+    anchor = cache.find_anchor([path for instr, path in files])
+    start_ns = cache.recording_ns(start) if start is not None else None
+    end_ns = cache.recording_ns(end) if end is not None else None
+    times = []
+    values = []
+    chans = []
+    for i, (instr, path) in enumerate(files):
+        ts, vals = cache.load(path, anchor)
+        first, last = cache.span(ts, start_ns, end_ns)
+        times.append(ts[first:last])
+        values.append(np.where(np.isnan(vals[first:last]), 0, vals[first:last]))
+        chans.append(np.full(last - first, i))
+    times = np.concatenate(times)
+    if not len(times):
+        return
+    values = np.concatenate(values)
+    chans = np.concatenate(chans)
+    order = np.lexsort((chans, times))
+    # the recording's local times on the epoch clock
+    offset = tb.from_datetime(cache.recording_datetime(times[order[0]])) - times[order[0]]
+    for ts, i, value in zip((times[order] + offset).tolist(), chans[order].tolist(), values[order].tolist()):
+        yield ts, files[i][0].name, files[i][0].v_type, value
+
+# replay READINGS ((epoch ns, name, v_type, value), as from raw_readings) of a recorded session with
+# INSTRUMENTS through a PlumeAnalyzer writing to FILEPATH - returns the analyzer and a stats dict
+#
+# the readings are analysed in FRAME steps of recording time, each frame getting the readings
+# stamped up to it - the same frames the plotter's analysis worker runs live, so the output is
+# the same, only as fast as the readings can be read. the session runs on for the
+# analysis horizons after the last reading so every plume and second is written.
+def analyse(readings, instruments, filepath):
+    analyzer = PlumeAnalyzer(instruments, filepath)
+    step = int(FRAME * tb.NS)
+    stats = {'readings': 0, 'frames': 0, 'errors': collections.Counter()}
+    started = time.time()
+
+    def run_frame(now):
+        if analyzer.setSummary:
+            analyzer.setupSummary()
+        # a frame that fails is retried by the next one, as in the plotter's analysis worker
+        try:
+            analyzer.analyze(now)
+            analyzer.write_ts(now)
+        except Exception as e:
+            if not stats['errors'][type(e).__name__]:
+                sys.stdout.write("frame at %s failed: %r\n" % (tb.to_datetime(now), e))
+            stats['errors'][type(e).__name__] += 1
+        stats['frames'] += 1
+
+    frame = None
+    for ts, name, v_type, value in readings:
+        if frame is None:
+            frame = tb.floor_s(ts) * tb.NS
+        while ts > frame:
+            run_frame(frame)
+            frame += step
+        if analyzer.getIdByName(name, v_type) is None:
+            analyzer.add_instrument(eng.Instrument(name, v_type))
+        analyzer.align_ts(([name, v_type], [value, ts]), v_type)
+        stats['readings'] += 1
+    if frame is not None:
+        end = frame + 200 * tb.NS
+        while frame < end:
+            run_frame(frame)
+            frame += step
+
+    stats['elapsed'] = time.time() - started
+    return analyzer, stats
+
+# analyse recorded session RAW_PATH (a raw_data.csv) without the GUI, writing the plume and secondly
+# files to FILEPATH (a new csv_outputs/ session if None)
+def batch(raw_path, filepath=None):
+    if filepath is None:
+        filepath = session_dir()
+    analyzer, stats = analyse(raw_readings(raw_path), session_instruments(raw_path), filepath)
+    sys.stdout.write("%d readings in %d frames analysed in %.1fs - results in %s\n" % (stats['readings'], stats['frames'], stats['elapsed'], filepath))
+    if stats['errors']:
+        sys.stdout.write("failed frames: %s\n" % dict(stats['errors']))
+    sys.stdout.flush()
+    return analyzer
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import collections
+import csv
+import operator
+import threading
+import time
+import traceback
+from datetime import datetime
+import analysis as an
+import timebase as tb
+
+# seconds of readings and plumes the plots show
+PLOT_SPAN = 180
+
+# what the plotter draws - published by the worker every frame and never changed afterwards
+#   time   - epoch ns the frame was analysed at
+#   data   - species -> instrument name -> ((epoch ns, ...), (value, ...)) for the last PLOT_SPAN s
+#   plumes - species -> instrument name -> ((start s, stop s), ...) for plumes starting in it
+#   added  - instruments that started reporting while running, in order
+#   timing - seconds the frame took to (update data, analyze, write summary)
+Snapshot = collections.namedtuple('Snapshot', 'time data plumes added timing')
+
+# runs the analysis in its own thread, off the wx main loop
+#
+# every frame (INTERVAL seconds apart, or back to back for a replay stepped by its clock) the
+# worker takes what the ingest buffer holds, writes the readings to raw_data.csv, aligns them for
+# the analyzer and runs analyze/write_ts, then publishes a Snapshot. the plotter's timer only
+# draws the latest snapshot, so a slow redraw never holds up plume detection or the output files.
+class AnalysisWorker(object):
+
+    def __init__(self, analyzer, ingest, plotfile, metricsfile, chan_lookup, now_ns, rings=None, clock=None, interval=an.FRAME):
+        self.analyzer = analyzer
+        self.ingest = ingest
+        self.plotfile = plotfile
+        self.metricsfile = metricsfile
+        self.chan_lookup = chan_lookup
+        self.now_ns = now_ns
+        self.rings = rings
+        self.clock = clock
+        self.interval = interval
+        # species -> [epoch ns, value, channel] readings of the last PLOT_SPAN s
+        self.data = {'CO2': [], 'NOX': [], 'BC': []}
+        self.added = ()
+        # readings of chan ids not (yet) in chan_lookup, skipped
+        self.unknown = collections.Counter()
+        # latest Snapshot, None until the first frame is done
+        self.snapshot = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            started = time.time()
+            try:
+                self.step()
+            except Exception:
+                # a frame that fails is retried by the next one
+                traceback.print_exc()
+            if self.clock is not None:
+                self.clock.advance()
+            time.sleep(max(self.interval - (time.time() - started), 0))
+
+    # one frame
+    def step(self):
+        started = time.time()
+        self.update_data()
+        if self.analyzer.setSummary:
+            self.analyzer.setupSummary()
+
+        # epoch nanoseconds
+        current_time = self.now_ns()
+        oldest = current_time - PLOT_SPAN * tb.NS
+        for species in self.data:
+            self.data[species] = [x for x in self.data[species] if x[0] >= oldest]
+        updated = time.time()
+
+        # plume analysis and summary write
+        self.analyzer.analyze(current_time)
+        analyzed = time.time()
+        self.analyzer.write_ts(current_time)
+        written = time.time()
+
+        self.publish(current_time, (updated - started, analyzed - updated, written - analyzed))
+
+    def publish(self, current_time, timing):
+        current_s = current_time / 1e9
+        data = {}
+        for species, readings in self.data.items():
+            chans = collections.defaultdict(list)
+            for x in sorted(readings, key=operator.itemgetter(0)):
+                chans[x[2]].append((x[0], x[1]))
+            data[species] = dict((self.analyzer.getNameById(i, species), tuple(zip(*rows))) for i, rows in chans.items())
+        plumes = {}
+        for species, chans in self.analyzer.plumes.items():
+            plumes[species] = dict((self.analyzer.getNameById(i, species), tuple(tuple(p) for p in chan_plumes if current_s - p[0] <= PLOT_SPAN))
+                for i, chan_plumes in chans.items())
+        self.snapshot = Snapshot(current_time, data, plumes, self.added, timing)
+
+    def update_data(self):
+        csv_post = []
+        for item in self.ingest.drain():
+            if item[0] == 'rec':
+                instr = self.chan_lookup.get(item[1])
+                if instr is None:
+                    if not self.unknown[item[1]]:
+                        print(('reading from unknown channel', item[1]))
+                    self.unknown[item[1]] += 1
+                    continue
+                self.add_dp(([instr.name, instr.v_type], [item[2], item[3]]), csv_post)
+            elif item[0] == 'instrument_added':
+                self.add_instrument(item[1])
+            elif item[0] == 'metrics':
+                self.write_metrics(item[1])
+            elif item[0] == 'instrument_removed':
+                # keep the channel - its columns just stay empty until it is plugged back in
+                print(('instrument removed', self.chan_lookup.get(item[1])))
+            else:
+                self.add_dp(item, csv_post)
+        if self.rings is not None:
+            for chan, instr in self.chan_lookup.items():
+                if chan >= len(self.rings):
+                    continue
+                for view in self.rings[chan].read():
+                    for rec in view:
+                        self.add_dp(([instr.name, instr.v_type], [float(rec['value']), int(rec['ts'])]), csv_post)
+        with open(self.plotfile, mode='ab') as plotFile:
+            csv_post.sort(key=operator.itemgetter(0))
+            for row in csv_post:
+                row[0] = tb.to_datetime(row[0])
+            writer = csv.writer(plotFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerows(csv_post)
+
+    # acquisition telemetry ROWS (telemetry.COLUMNS, epoch ns timestamps) to metrics.csv
+    def write_metrics(self, rows):
+        with open(self.metricsfile, mode='ab') as metricsFile:
+            writer = csv.writer(metricsFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerows([[tb.to_datetime(row[0])] + row[1:] for row in rows])
+
+    # add an instrument INSTR plugged in while running (sent by data_ac as 'instrument_added') - the
+    # plotter picks it up from the snapshot's added instruments
+    # an instrument that was unplugged and comes back keeps its old channel
+    def add_instrument(self, instr):
+        self.chan_lookup[instr.chan_id] = instr
+        if self.analyzer.add_instrument(instr) is None:
+            return
+        print(('instrument added', instr))
+        self.added += (instr,)
+
+    # add a single reading ITEM to the plot data and the aligned time series
+    def add_dp(self, item, csv_post):
+        if isinstance(item[1][1], datetime):
+            item[1][1] = tb.from_datetime(item[1][1])
+        csv_post.append([item[1][1], item[0][0], item[0][1], item[1][0]])
+        if item[0][1] in self.data:
+            self.data[item[0][1]].append([item[1][1], item[1][0], self.analyzer.getIdByName(item[0][0], item[0][1])])
+        else:
+            print('error bad send')
+        self.analyzer.align_ts(item, item[0][1])
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import sys
+import csv
+import time
+import shutil
+import collections
+from argparse import ArgumentParser
+from datetime import timedelta
+from multiprocessing import Pool, cpu_count
+import analysis as an
+import replay_cache as cache
+import timebase as tb
+
+# seconds of recording analysed per task
+CHUNK = 3600
+# seconds read before and after a chunk so the analysis horizons (the 30 s guessing window, the
+# 45 s plume end) and the plume lookback work across chunk edges as in one long run
+OVERLAP = 300
+
+# regenerates the plume tables of many recorded sessions at once
+#
+# every session (a csv_outputs/<run> with raw_data.csv, or a plume_results/<campaign>) is cut into
+# CHUNK-long pieces of recording time, which are analysed with analysis.analyse in a pool of worker
+# processes. a piece reads OVERLAP seconds either side of it and keeps only the seconds and the
+# plumes ending inside it, so the pieces join up. the per-session tables are written to
+# OUT/<session>/ and every plume of every session to the combined OUT/plume_events.csv and
+# OUT/plumes.csv (emission factors), with a session column.
+
+Session = collections.namedtuple('Session', 'name kind path')
+Chunk = collections.namedtuple('Chunk', 'session index start end filepath')
+
+# sessions found at PATH - a session, or a directory of them (e.g. csv_outputs/)
+def find_sessions(path):
+    path = os.path.abspath(path)
+    if os.path.isfile(path):
+        return [Session(os.path.basename(os.path.dirname(path)), 'raw', path)]
+    if os.path.exists(os.path.join(path, 'raw_data.csv')):
+        return [Session(os.path.basename(path), 'raw', os.path.join(path, 'raw_data.csv'))]
+    if an.campaign_instruments(path):
+        return [Session(os.path.basename(path), 'campaign', path)]
+    sessions = []
+    for name in sorted(os.listdir(path)):
+        if os.path.isdir(os.path.join(path, name)):
+            sessions += find_sessions(os.path.join(path, name))
+    return sessions
+
+# (first, last) recorded datetimes of SESSION - minute precision, which is all chunking needs
+def session_span(session):
+    if session.kind == 'raw':
+        minutes, offsets = cache.minute_index(session.path)
+        if not len(minutes):
+            return None
+        first, last = minutes[0], minutes[-1] + cache.MINUTE
+    else:
+        files = an.campaign_instruments(session.path)
+        anchor = cache.find_anchor([path for instr, path in files])
+        times = [cache.load(path, anchor)[0] for instr, path in files]
+        times = [ts for ts in times if len(ts)]
+        if not times:
+            return None
+        first = min(ts.min() for ts in times)
+        last = max(ts.max() for ts in times) + tb.NS
+    return cache.recording_datetime(first), cache.recording_datetime(last)
+
+def chunks(session, out):
+    span = session_span(session)
+    if span is None:
+        return []
+    first, last = span
+    ret = []
+    start = first.replace(second=0, microsecond=0)
+    while start < last:
+        end = start + timedelta(seconds=CHUNK)
+        ret.append(Chunk(session, len(ret), start, end, os.path.join(out, session.name, 'chunks', str(len(ret)), '')))
+        start = end
+    return ret
+
+def quiet():
+    # the analyzer reports every guess - keep the workers' output to the progress lines
+    sys.stdout = open(os.devnull, 'w')
+
+# analyse CHUNK in a worker - returns it with the analysis stats
+def run_chunk(chunk):
+    session = chunk.session
+    start = chunk.start - timedelta(seconds=OVERLAP)
+    end = chunk.end + timedelta(seconds=OVERLAP)
+    if session.kind == 'raw':
+        readings = an.raw_readings(session.path, start, end)
+        instruments = an.session_instruments(session.path)
+    else:
+        readings = an.campaign_readings(session.path, start, end)
+        instruments = [instr for instr, path in an.campaign_instruments(session.path)]
+    analyzer, stats = an.analyse(readings, instruments, chunk.filepath)
+    return chunk, stats
+
+def read_rows(path):
+    with open(path) as f:
+        return list(csv.reader(f, delimiter=','))
+
+# join the CHUNKS of a session into its tables in OUT/<session>/ - returns the plume event and
+# plume rows kept
+def merge_session(chunks, out):
+    directory = os.path.join(out, chunks[0].session.name)
+    shutil.copy(chunks[0].filepath + 'instruments.csv', directory)
+    events = []
+    plumes = []
+    seconds = []
+    header = None
+    for chunk in chunks:
+        start, end = tb.from_datetime(chunk.start), tb.from_datetime(chunk.end)
+        kept = set()
+        for row in read_rows(chunk.filepath + 'plume_events.csv')[1:]:
+            if start <= an.parse_timestamp(row[1]) < end:
+                events.append(row)
+                kept.add(row[2])
+        plumes += [row for row in read_rows(chunk.filepath + 'plumes.csv')[1:] if row[0] in kept]
+        for row in read_rows(chunk.filepath + 'secondly_data.csv'):
+            if row[0] == 'Timestamp':
+                # instruments that started reporting mid-session add a header block
+                if row != header:
+                    header = row
+                    seconds.append(row)
+            elif start <= an.parse_timestamp(row[0]) < end:
+                seconds.append(row)
+    event_header = read_rows(chunks[0].filepath + 'plume_events.csv')[0]
+    plume_header = read_rows(chunks[0].filepath + 'plumes.csv')[0]
+    for name, rows in (('plume_events.csv', [event_header] + events), ('plumes.csv', [plume_header] + plumes), ('secondly_data.csv', seconds)):
+        with open(os.path.join(directory, name), mode='wb') as f:
+            writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            writer.writerows(rows)
+    shutil.rmtree(os.path.join(directory, 'chunks'))
+    return event_header, events, plume_header, plumes
+
+# reprocess every session at PATHS into OUT with WORKERS processes
+def run(paths, out, workers=None):
+    out = os.path.abspath(out)
+    sessions = []
+    for path in paths:
+        sessions += find_sessions(path)
+    tasks = []
+    for session in sessions:
+        tasks += chunks(session, out)
+    workers = workers or cpu_count()
+    sys.stdout.write("%d sessions in %d chunks of %ds, %d workers\n" % (len(sessions), len(tasks), CHUNK, workers))
+    sys.stdout.flush()
+
+    started = time.time()
+    done = collections.defaultdict(list)
+    readings = 0
+    errors = collections.Counter()
+    pool = Pool(workers, quiet)
+    try:
+        for i, (chunk, stats) in enumerate(pool.imap_unordered(run_chunk, tasks)):
+            done[chunk.session].append(chunk)
+            readings += stats['readings']
+            errors.update(stats['errors'])
+            sys.stdout.write("[%d/%d] %s %s - %s: %d readings in %.1fs (%d rows/sec)\n" % (i + 1, len(tasks), chunk.session.name,
+                chunk.start, chunk.end.time(), stats['readings'], stats['elapsed'], stats['readings'] / max(stats['elapsed'], 1e-3)))
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+    combined_events = []
+    combined_plumes = []
+    for session in sessions:
+        if not done[session]:
+            continue
+        event_header, events, plume_header, plumes = merge_session(sorted(done[session], key=lambda c: c.index), out)
+        combined_events += [[session.name] + row for row in events]
+        combined_plumes += [[session.name] + row for row in plumes]
+    if combined_events or combined_plumes:
+        for name, header, rows in (('plume_events.csv', event_header, combined_events), ('plumes.csv', plume_header, combined_plumes)):
+            with open(os.path.join(out, name), mode='wb') as f:
+                writer = csv.writer(f, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+                writer.writerow(['session'] + header)
+                writer.writerows(rows)
+
+    elapsed = time.time() - started
+    sys.stdout.write("%d sessions, %d plumes in %.1fs - %.1f sessions/min, %d rows/sec - results in %s\n" % (len(sessions), len(combined_events),
+        elapsed, len(sessions) * 60.0 / max(elapsed, 1e-3), readings / max(elapsed, 1e-3), out))
+    if errors:
+        sys.stdout.write("failed frames: %s\n" % dict(errors))
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument("paths", nargs='+', help="sessions to reprocess - csv_outputs/<run>, plume_results/<campaign>, or directories of them")
+    parser.add_argument("-o", "--out", default='reprocessed', help="directory to write the tables to")
+    parser.add_argument("-j", "--workers", type=int, help="worker processes (one per cpu by default)")
+    parser.add_argument("--chunk", type=int, default=CHUNK, help="seconds of recording per task")
+    args = parser.parse_args()
+
+    CHUNK = args.chunk
+    run(args.paths, args.out, args.workers)
@@ -1,13 +1,19 @@
 import serial.tools.list_ports
 import signal
-from datetime import datetime
 import time
 import threading
 import collections
-import fcntl
 from multiprocessing import Process, Queue
-import os, sys, csv, re, math
+import os, sys, csv, re, math, glob
 import numpy as np
+import raw_writer as r_w
+import line_parser as lp
+import mux_reader as mux
+import poll_scheduler as ps
+import port_watcher as pw
+import ipc_batch as ipc
+import timebase as tb
+import telemetry as tm
 
 # flag for if we should stop the program
 stop_requested = False
@@ -15,6 +21,31 @@ stop_requested = False
 bc_correction = 0.88
 # instrument dictionary - initialized instruments are automatically added
 instruments = []
+# raw capture writer shared by every instrument - started in main_wrapper
+raw_writer = None
+# how readings are sent to the plotter - 'queue' (one tuple per reading), 'batch' (binary batches)
+# or 'ring' (shared-memory ring per channel)
+transport = 'queue'
+# ring_buffer.RingPool allocated by the plotter for the 'ring' transport
+ring_pool = None
+# per-process batch sender, created on first use for the 'batch' transport
+batch_sender = None
+
+# directory the instrument serial devices are found in - point it at sim_farm.py's directory
+# to run against simulated instruments
+device_dir = '/dev'
+
+# running acquisition, used to attach and detach hot-plugged instruments - set up in main_wrapper
+data_queue = None
+reader = None
+scheduler = None
+# device -> attached instrument, instrument -> its process ('process' acquisition)
+attached = {}
+processes = {}
+
+# path of serial device NAME (e.g. 'usbserial-FTXP6UA4') in device_dir
+def device_path(name):
+	return os.path.join(device_dir, 'cu.' + name)
 
 # generate a serial connection with DEVICE over baudrate BAUDRATE
 def serialGeneric(device,baudrate):
@@ -36,12 +67,20 @@ def sig_handler(signum, frame):
 	stop_requested = True
 
 class Instrument(object):
+	# polled instruments (request/response) are serviced by the poll scheduler - POLL_REQUEST is
+	# written every POLL_INTERVAL seconds (None = scheduler default)
+	polled = False
+	poll_request = None
+	poll_interval = None
 
 	# initialize instrument with serial connection and add it to instrument dict
 	def __init__(self, comport, baudrate):
 		if comport:
 			self.serial = serialGeneric(comport, baudrate)
+		self.device = comport if comport else self.serial.port
 		global instruments
+		# channel id used by the binary transports
+		self.chan_id = len(instruments)
 		instruments.append(self)
 
 	def __str__(self):
@@ -50,384 +89,389 @@ class Instrument(object):
 	def __repr__(self):
 		return self.__str__()
 
-	# dumps the serial output SER, which was received at datetime DT, into rawraw_data.csv
-	def dumpserial(self, ser, dt):
-		with open(filepath + 'rawraw_data.csv', mode='ab') as rawFile:
-			fcntl.flock(rawFile, fcntl.LOCK_EX)
-			rawData = csv.writer(rawFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-			rawData.writerow([dt, self.name, self.serial_num, ser])
-			fcntl.flock(rawFile, fcntl.LOCK_UN)
+	# dumps the serial output SER, which was received at epoch nanoseconds TS, into rawraw_data.csv
+	def dumpserial(self, ser, ts):
+		raw_writer.put(ts, self.name, self.serial_num, ser)
 		return
 
 	# continually call Instr get_values() func to receive serial output until STOP_REQUESTED
 	def run(self, queue):
 		while not stop_requested:
 			values = self.get_values()
+			tm.registry.poll(queue)
 			if values is None:
 				continue
 			else:
-				data_pack = ([self.name, self.v_type], values)
-				# print(data_pack)
-				queue.put(data_pack)
+				self.publish(queue, values)
+				tm.registry.get(self).latency((tb.now_ns() - values[1]) / 1e9)
 		if stop_requested:
 			self.serial.close()
+			if batch_sender is not None:
+				batch_sender.flush()
+
+	# send parsed VALUES to the plotter
+	# channels beyond the ring slots (e.g. hot-plugged ones) fall back to batches
+	def publish(self, queue, values):
+		if transport == 'ring' and self.chan_id < len(ring_pool):
+			ring_pool[self.chan_id].write(self.chan_id, values[1], values[0])
+		elif transport in ('ring', 'batch'):
+			global batch_sender
+			if batch_sender is None:
+				batch_sender = ipc.BatchSender(queue)
+			batch_sender.add(self.chan_id, values[1], values[0])
+		else:
+			data_pack = ([self.name, self.v_type], values)
+			# print(data_pack)
+			queue.put(data_pack)
+
+	# one-time setup before the multiplexed reader starts servicing the port
+	def prepare(self):
+		return
+
+	# split one complete response off the front of BUF - returns (response, rest), or (None, BUF)
+	# if the response isn't complete yet
+	def split_response(self, buf):
+		if '\n' not in buf:
+			return None, buf
+		resp, rest = buf.split('\n', 1)
+		return resp + '\n', rest
+
+	# read one line from the serial connection and parse it
+	def get_values(self):
+		ser = self.serial.readline()
+		return self.handle_line(ser)
+
+	# timestamp and dump the serial output SER, then parse it with the instrument's parser
+	def handle_line(self, ser):
+		ts = tb.now_ns()
+		self.dumpserial(ser, ts)
+		values = self.parser.parse(ser, ts)
+		tm.registry.get(self).line(ts, len(ser), values is not None)
+		return values
 
-	# def get_values(self):
-	# exists for each defined instrument below, parses serial output to a datetime and value (sometimes includes attn and flow)
+	# parser = lp.LineParser(...)
+	# declared by each delimited instrument below - delimiter, (field index, divisor) pairs and
+	# attenuation correction; parses serial output to a value, epoch-ns timestamp and extras (flow, attn, temp, pressure)
 
 # BC Instr
 
 class AE33_Instrument(Instrument):
+	# bc (ng/m3), flow
+	parser = lp.LineParser('ae33', ',', [(9, 1000), (10, 1)])
+
 	def __init__(self, sn):
 		self.name = 'AE33'
 		self.v_type = 'BC'
 		self.serial_num = sn
-		super(AE33_Instrument, self).__init__('/dev/cu.usbserial-' + self.serial_num, 9600)
-
-	def get_values(self):
-		bc_values = []
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str3 = dt_object.strftime('%H:%M:%S')
-		values_ae33 = ser.split('\n')[0].split(',')
-		time_now=int(time.time()*1000000000)
-		try:
-			bc2 = float(values_ae33[9])
-			bc_ae33 = bc2/1000
-			flow = float(values_ae33[10])
-			bc_values.insert(0,bc_ae33)
-			bc_values.insert(1,dt_object)
-			bc_values.insert(2,flow)
-		except(ValueError,IndexError) as e:
-			print("ae33 index failure")
-			return None
-		return bc_values
+		super(AE33_Instrument, self).__init__(device_path('usbserial-' + self.serial_num), 9600)
 
 class AE16_Instrument(Instrument):
+	# bc (ng/m3), flow, attn
+	parser = lp.LineParser('ae16', ',', [(2, 1000), (3, 1), (9, 1)], attenuation=2, correction=bc_correction)
+
 	def __init__(self, sn):
 		self.name = 'AE16'
 		self.v_type = 'BC'
 		self.serial_num = sn
-		super(AE16_Instrument, self).__init__('/dev/cu.usbserial-' + self.serial_num, 9600)
-
-	def get_values(self):
-		bc_values = []
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str2 = dt_object.strftime('%H:%M:%S')
-		values_ae16 = ser.split('\n')[0].split(',')
-		time_now=int(time.time()*1000000000)
-		try:
-			#print(values_ae16)
-			bc1 = float(values_ae16[2])
-			bc = bc1/1000
-			atn = float(values_ae16[9])
-			bc = bc / (math.exp((-1*atn)/100)*bc_correction + (1-bc_correction))
-			flow = float(values_ae16[3])
-			bc_values.insert(0,bc)
-			bc_values.insert(1,dt_object)
-			bc_values.insert(2,flow)
-			bc_values.insert(3,atn)
-
-		except(ValueError,IndexError) as e:
-			print("ae16 index error")
-			return None
-		return bc_values
+		super(AE16_Instrument, self).__init__(device_path('usbserial-' + self.serial_num), 9600)
 
 class ABCD_Instrument(Instrument):
+	# bc, flow, attn
+	parser = lp.LineParser('abcd', ',', [(4, 1), (7, 1), (3, 1)], attenuation=2, correction=bc_correction)
+
 	def __init__(self, serial_num):
 		self.name = 'ABCD'
 		self.v_type = 'BC'
 		self.serial_num = serial_num
 		if 'wchusbserial' in self.serial_num:
-			path = '/dev/cu.' + self.serial_num
+			path = device_path(self.serial_num)
 		else:
-			path = '/dev/cu.usbserial-' + self.serial_num
+			path = device_path('usbserial-' + self.serial_num)
 		super(ABCD_Instrument, self).__init__(path, 57600)
 
-	def get_values(self):
-		bc_values = []
-		ser = self.serial.readline()
-		values_abcd1 = ser.split('\n')[0].split(',')
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		#print(values_abcd1)
-		time_now=int(time.time()*1000000000)
-		#time_str1 = dt_object.strftime('%H:%M:%S')
-		try:
-			#print(values_abcd1)
-			atn = float(values_abcd1[3])
-			bc = float(values_abcd1[4])
-			bc = bc / (math.exp((-1*atn)/100)*bc_correction + (1-bc_correction))
-			flow = float(values_abcd1[7])
-			bc_values.insert(0,bc)
-			bc_values.insert(1,dt_object)
-			bc_values.insert(2,flow)
-			bc_values.insert(3,atn)
-			#print(bc_abcd1)
-
-		except (ValueError,IndexError) as e:
-			print("abcd index failure")
-			return None
-		return bc_values
-
 class MA300_Instrument(Instrument):
+	# bc (ng/m3), flow, attn
+	parser = lp.LineParser('ma300', ',', [(44, 1000), (4, 1), (9, 1)], attenuation=2, correction=bc_correction)
+
 	def __init__(self, sn):
 		self.name = 'MA300'
 		self.v_type = 'BC'
 		self.serial_num = sn
-		super(MA300_Instrument, self).__init__('/dev/cu.usbserial-' + self.serial_num, 1000000)
-
-	def get_values(self):
-		bc_values = []
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str2 = dt_object.strftime('%H:%M:%S')
-		values_ae16 = ser.split('\n')[0].split(',')
-		time_now=int(time.time()*1000000000)
-
-		try:
-			#print(values_ae16)
-			bc1 = float(values_ae16[44])
-			bc = bc1/1000
-			atn = float(values_ae16[9])
-			bc = bc / (math.exp((-1*atn)/100)*bc_correction + (1-bc_correction))
-			flow = float(values_ae16[4])
-			bc_values.insert(0,bc)
-			bc_values.insert(1,dt_object)
-			bc_values.insert(2,flow)
-			bc_values.insert(3,atn)
-
-		except(ValueError,IndexError) as e:
-			print("ma300 index error")
-			return None
-		return bc_values
+		super(MA300_Instrument, self).__init__(device_path('usbserial-' + self.serial_num), 1000000)
 
 # CO2 Instr
 class LI7000_Instrument(Instrument):
+	# co2, temp, pressure
+	parser = lp.LineParser('li7000', '\t', [(8, 1), (24, 1), (21, 1)])
+
 	def __init__(self, sn):
 		self.name = 'LI7000'
 		self.v_type = 'CO2'
 		self.serial_num = sn
-		super(LI7000_Instrument, self).__init__('/dev/cu.usbserial-' + self.serial_num, 9600)
-
-	def get_values(self):
-		co2_values = []
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str5 = dt_object.strftime('%H:%M:%S')
-		time_now=int(time.time()*1000000000)
-		try:
-			values_li7000 = ser.split('\n')[0].split('\t')
-
-			#print("The values for li700 are:")
-			#print(values_li7000)
-			co2_values.insert(0,float(values_li7000[8])) # CO2 value
-			co2_values.insert(1,dt_object)
-			co2_values.insert(2,float(values_li7000[24])) # Temp
-			co2_values.insert(3,float(values_li7000[21])) # Pressure
-			#print(co2_values)
-		except (ValueError,IndexError) as e:
-			print("li7000 index failure")
-			return None
-		return co2_values
+		super(LI7000_Instrument, self).__init__(device_path('usbserial-' + self.serial_num), 9600)
 
 class LI820_Instrument(Instrument):
+	# co2, temp, pressure - xml-ish tag output, split on both tag brackets
+	parser = lp.LineParser('li820', '<>', [(14, 1), (6, 1), (10, 1)])
+
 	def __init__(self, sn):
 		self.name = 'LI820'
 		self.v_type = 'CO2'
 		self.serial_num = sn
-		super(LI820_Instrument, self).__init__('/dev/cu.usbserial-' + self.serial_num, 9600)
-
-	def get_values(self):
-		co2_values = []
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str4 = dt_object.strftime('%H:%M:%S')
-		time_now=int(time.time()*1000000000)
-		try:
-			values_li820 = re.split(r'[<>]', ser)
-			#print(values_1820)
-			co2_values.insert(0,float(values_li820[14])) # CO2 value
-			co2_values.insert(1,dt_object)
-			co2_values.insert(2,float(values_li820[6])) # Temp
-			co2_values.insert(3,float(values_li820[10])) # Pressure
-
-		except(ValueError,IndexError) as e:
-			print("li820 index failure")
-			return None
-		return co2_values
+		super(LI820_Instrument, self).__init__(device_path('usbserial-' + self.serial_num), 9600)
 
 class SBA5_Instrument(Instrument):
+	# co2, temp, pressure
+	parser = lp.LineParser('sba5', ' ', [(3, 1), (4, 1), (7, 1000)])
+
 	def __init__(self, sn):
 		self.name = 'SBA5'
 		self.v_type = 'CO2'
 		self.serial_num = sn
-		super(SBA5_Instrument, self).__init__('/dev/cu.usbserial-' + self.serial_num, 19200)
-
-	def get_values(self):
-		co2_values = []
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str6 = dt_object.strftime('%H:%M:%S')
-		values_sba5 = ser.split('\n')[0].split(' ')
-		time_now=int(time.time()*1000000000)
-
-		try:
-			#print(values_sba5)
-			#print(float(values_sba5[7]))
-			co2_values.insert(0,float(values_sba5[3])) # CO2 value
-			co2_values.insert(1,dt_object)# Time
-			co2_values.insert(2,float(values_sba5[4])) # CO2 temp
-			co2_values.insert(3,(float(values_sba5[7])/1000)) # CO2 pressure
-
-
-
-		except (ValueError, IndexError) as e:
-			print("sba5 index failure")
-			return None
-		return co2_values
+		super(SBA5_Instrument, self).__init__(device_path('usbserial-' + self.serial_num), 19200)
 
 class VCO2_Instrument(Instrument):
+	# co2, temp
+	parser = lp.LineParser('vco2', '\t', [(0, 1), (1, 1)])
+	# polled with SEND by the scheduler, continuous 'R' output when read through get_values()
+	polled = True
+	poll_request = "SEND\r\n"
+
 	def __init__(self, sn=''):
 		self.name = 'Vaisala'
 		self.v_type = 'CO2'
 		self.serial_num = sn
 		self.setup = True
 		if self.serial_num:
-			path = '/dev/cu.usbserial-' + self.serial_num
+			path = device_path('usbserial-' + self.serial_num)
 		else:
-			path = '/dev/cu.usbserial'
+			path = device_path('usbserial')
 		super(VCO2_Instrument, self).__init__(path, 19200)
 
 	def get_values(self):
+		self.prepare()
+		return super(VCO2_Instrument, self).get_values()
+
+	# start continuous output
+	def prepare(self):
 		if self.setup:
 			self.serial.write("R\r\n")
 			response=self.serial.readline()
 			self.setup = False
-		co2_values = []
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str8 = dt_object.strftime('%H:%M:%S')
-		values_vco2 = ser.split('\n')[0].split('\t')
-		time_now=int(time.time()*1000000000)
-
-		try:
-			#print(values_vco2)
-			co2_values.insert(0,float(values_vco2[0])) # CO2
-			co2_values.insert(1,dt_object) # time
-			co2_values.insert(2,float(values_vco2[1])) # temp
-			#co2_values.insert(3,float(999)) #pressure
 
+# parses the K30's fixed 7 byte response frame, same interface as lp.LineParser
+class K30Parser(object):
+	name = 'k30'
+	# start of a read response frame
+	header = "\xFE\x44\x02"
 
-		except (ValueError, IndexError) as e:
-			print("vco2 index failure")
+	def parse(self, resp, ts):
+		if not resp.startswith(self.header):
+			return None
+		try:
+			co2 = (ord(resp[3])*256) + ord(resp[4])
+		except IndexError:
 			return None
-		return co2_values
+		return [co2, ts]
 
+# binary request/response protocol
 class K30_Instrument(Instrument):
+	parser = K30Parser()
+	polled = True
+	poll_request = "\xFE\x44\x00\x08\x02\x9F\x25"
+	poll_interval = 0.6
+
 	def __init__(self, sn):
 		self.name = 'K30'
 		self.v_type = 'CO2'
 		self.serial_num = sn
-		self.serial = serial.Serial(port='/dev/cu.usbserial-' + self.serial_num, baudrate=9600, timeout=0.5)
+		self.serial = serial.Serial(port=device_path('usbserial-' + self.serial_num), baudrate=9600, timeout=0.5)
 		self.serial.flushInput()
-		time.sleep(1)
 		super(K30_Instrument, self).__init__(None, 9600)
 
-	def get_values(self):
-		co2_values = []
-		self.serial.flushInput()
-		self.serial.write("\xFE\x44\x00\x08\x02\x9F\x25")
-		time.sleep(0.5)
-		resp = self.serial.read(7)
-		dt_object = datetime.now()
-		self.dumpserial(resp, dt_object)
-		time_str10 = dt_object.strftime('%H:%M:%S')
-		time_now=int(time.time()*1000000000)
-		high = ord(resp[3])
-		low = ord(resp[4])
-		co2 = (high*256) + low
-		time.sleep(0.1)
-
-		try:
-			co2_values.insert(0, co2)
-			co2_values.insert(1, dt_object)
-
-		except Exception as e:
-			print("k30 index failure")
-			return None
-		return co2_values
+	# fixed 7 byte response frame - bytes before its header are dropped, so a late response to a
+	# request that timed out can't leave the frames out of step
+	def split_response(self, buf):
+		start = buf.find(self.parser.header)
+		if start < 0:
+			# keep what could be the start of a header
+			return None, buf[-(len(self.parser.header) - 1):]
+		buf = buf[start:]
+		if len(buf) < 7:
+			return None, buf
+		return buf[:7], buf[7:]
 
 
 # NOX Instr
 class UCB_Instrument(Instrument):
+	# nox
+	parser = lp.LineParser('ucb', ',', [(1, 1)])
+	polled = True
+	poll_request = b'\x0201RD0\x03\x26'
+
 	def __init__(self, sn):
 		self.name = 'UCB'
 		self.v_type = 'NOX'
 		self.serial_num = sn
-		self.serial = serial.Serial(port='/dev/cu.usbserial-' + self.serial_num, baudrate=9600, timeout=1, bytesize=serial.SEVENBITS)
+		self.serial = serial.Serial(port=device_path('usbserial-' + self.serial_num), baudrate=9600, timeout=1, bytesize=serial.SEVENBITS)
 		super(UCB_Instrument, self).__init__(None, 9600)
 
 	def get_values(self):
-		nox_values = []
-		self.serial.write(b'\x0201RD0\x03\x26')
-		ser = self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str10 = dt_object.strftime('%H:%M:%S')
-		time_now=int(time.time()*1000000000)
-
-		try:
-			output_ucb = ser.decode('ascii')
-			values_ucb = output_ucb.split('\n')[0].split(',')
-			#print(values_ucb)
-			nox_values.insert(0,float(values_ucb[1]))
-			nox_values.insert(1,dt_object)
-
-		except Exception as e:
-			print("ucb index failure")
-			return None
-		return nox_values
+		self.serial.write(self.poll_request)
+		return super(UCB_Instrument, self).get_values()
 
 class CAPS_Instrument(Instrument):
+	# nox (ppb)
+	parser = lp.LineParser('caps', ',', [(1, 1000)])
+
 	def __init__(self, sn):
 		self.name = 'CAPS'
 		self.v_type = 'NOX'
 		self.serial_num = sn
-		super(CAPS_Instrument, self).__init__('/dev/cu.usbserial-' + self.serial_num, 9600)
-
-	def get_values(self):
-		nox_values = []
-		ser =  self.serial.readline()
-		dt_object = datetime.now()
-		self.dumpserial(ser, dt_object)
-		time_str9 = dt_object.strftime('%H:%M:%S')
-		values_caps = ser.split('\n')[0].split(',')
-		time_now=int(time.time()*1000000000)
-
+		super(CAPS_Instrument, self).__init__(device_path('usbserial-' + self.serial_num), 9600)
+
+# instrument name -> parser, for re-parsing captured serial output (see raw_capture.py and reparse_raw.py)
+parsers = {
+	'AE33': AE33_Instrument.parser,
+	'AE16': AE16_Instrument.parser,
+	'ABCD': ABCD_Instrument.parser,
+	'MA300': MA300_Instrument.parser,
+	'LI7000': LI7000_Instrument.parser,
+	'LI820': LI820_Instrument.parser,
+	'SBA5': SBA5_Instrument.parser,
+	'Vaisala': VCO2_Instrument.parser,
+	'K30': K30_Instrument.parser,
+	'UCB': UCB_Instrument.parser,
+	'CAPS': CAPS_Instrument.parser,
+	}
+
+# instrument name -> channel, for the raw_data.csv rows of re-parsed captures (see reparse_raw.py)
+channels = {
+	'AE33': 'BC',
+	'AE16': 'BC',
+	'ABCD': 'BC',
+	'MA300': 'BC',
+	'LI7000': 'CO2',
+	'LI820': 'CO2',
+	'SBA5': 'CO2',
+	'Vaisala': 'CO2',
+	'K30': 'CO2',
+	'UCB': 'NOX',
+	'CAPS': 'NOX',
+	}
+
+# dictionary mapping serial numbers to Instrument objects ** CHANGE THIS TO ADD MORE INSTRUMENTS **
+comport_dict = {
+	'FTXP6UA4': AE33_Instrument,
+	'FTXP9NHN': AE16_Instrument,
+	'wchusbserial': ABCD_Instrument,
+	# '142140': ABCD_Instrument,
+	'FT0HCK2R': MA300_Instrument,
+	'FTE4W8JS': LI7000_Instrument, 
+	'FTXP9HEV': LI820_Instrument,
+	'DN03Y92G': SBA5_Instrument,
+	'Vaisala':VCO2_Instrument,
+	'142340':VCO2_Instrument,
+	'141110':VCO2_Instrument,
+	'FTXP9VNO': UCB_Instrument, # CLD64 
+	'FTXPC1N7': CAPS_Instrument,
+	'AH06VSA4': K30_Instrument
+	}
+comport_pattern = re.compile('cu\.usbserial(\-(.)*)?$')
+
+# serial devices currently present - ports outside /dev (simulated ones) aren't listed by pyserial
+def list_devices():
+	if device_dir == '/dev':
+		return [element.device for element in serial.tools.list_ports.comports()]
+	return sorted(glob.glob(device_path('*')))
+
+# create the Instrument for serial DEVICE, or None if it isn't one of ours
+def instrument_for_device(device):
+	if os.path.dirname(device) != device_dir:
+		return None
+	name = os.path.basename(device)
+	try:
+		if comport_pattern.match(name):
+			if name == 'cu.usbserial':
+				return comport_dict['Vaisala']()
+			sn = name.split('cu.usbserial-')[1]
+			if sn in comport_dict:
+				return comport_dict[sn](sn)
+		elif name.startswith('cu.wchusbserial'):
+			sn = name.split('cu.')[1]
+			return comport_dict['wchusbserial'](sn)
+	except serial.SerialException as e:
+		print('could not open %s: %s' % (device, e))
+	return None
+
+# start servicing INSTR in the running acquisition
+def start_instrument(instr):
+	if reader is not None:
+		if instr.polled:
+			scheduler.add(instr)
+		else:
+			reader.add(instr)
+	else:
+		if instr.polled:
+			own_scheduler = ps.PollScheduler(data_queue)
+			own_scheduler.add(instr)
+			p = Process(target=own_scheduler.run, args=(lambda: stop_requested,))
+		else:
+			p = Process(target=instr.run, args=(data_queue,))
+		p.start()
+		processes[instr] = p
+
+# stop servicing INSTR in the running acquisition
+def stop_instrument(instr):
+	if reader is not None:
+		reader.remove(instr)
+		scheduler.remove(instr)
+		tm.registry.remove(instr)
 		try:
-			#print(values_caps)
-			nox1 = float(values_caps[1])
-			nox_values.insert(0,(nox1/1000))
-			nox_values.insert(1,dt_object)
-
-		except (ValueError, IndexError) as e:
-			print("caps index failure")
-			return None
-		return nox_values
+			instr.serial.close()
+		except (OSError, IOError, serial.SerialException):
+			pass
+	else:
+		p = processes.pop(instr, None)
+		# a shared poll scheduler process keeps running for the other polled instruments
+		if p is not None and p not in processes.values():
+			p.terminate()
+
+# port watcher callbacks - tell the plotter so it can grow or mark its channel tables
+def attach_device(device):
+	instr = instrument_for_device(device)
+	if instr is None:
+		return
+	print(('attached', instr))
+	attached[device] = instr
+	# announce before starting so the plotter knows the channel before its first reading
+	data_queue.put(('instrument_added', instr))
+	start_instrument(instr)
+
+def detach_device(device):
+	instr = attached.pop(device, None)
+	if instr is None:
+		return
+	print(('detached', instr))
+	stop_instrument(instr)
+	data_queue.put(('instrument_removed', instr.chan_id))
 
 # main method for use when file is run through multiprocessing (like in this ../cli.py)
-def main_wrapper(q):
-	global filepath
+# ACQUISITION - 'mux' services every instrument from one select() loop in this process, with polled
+# instruments driven by the poll scheduler. 'process' starts one process per streaming instrument
+# and runs the poll scheduler in one more process
+# TRANSPORT_MODE - 'batch' sends readings to the plotter in binary batches, 'queue' one tuple per reading,
+# 'ring' writes them to the shared-memory RINGS allocated by the plotter
+# RAW_FORMAT - 'csv' captures serial output to rawraw_data.csv, 'binary' to the framed rawraw_data.bin
+# (see raw_capture.py)
+def main_wrapper(q, acquisition='mux', transport_mode='batch', rings=None, devices=None, raw_format='csv'):
+	global filepath, raw_writer, transport, ring_pool, data_queue, reader, scheduler, device_dir
 	filepath = q.get()
+	if devices:
+		device_dir = os.path.abspath(devices)
+	transport = transport_mode
+	ring_pool = rings
+	data_queue = q
 
 	# create output dir using filepath (sent to queue Q from plotter.py)
 	if not os.path.exists(os.path.dirname(filepath)):
@@ -437,64 +481,72 @@ def main_wrapper(q):
                 if exc.errno != errno.EEXIST:
                     raise
 
-    # initialize rawraw_data.py header
-	with open(filepath + 'rawraw_data.csv', mode='wb') as rawFile:
-		rawData = csv.writer(rawFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-		rawData.writerow(['Timestamp', 'Instr', 'S#', 'Message'])
+	if raw_format == 'binary':
+		raw_path = filepath + 'rawraw_data.bin'
+	else:
+		raw_path = filepath + 'rawraw_data.csv'
+		# initialize rawraw_data.py header
+		with open(raw_path, mode='wb') as rawFile:
+			rawData = csv.writer(rawFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+			rawData.writerow(['Timestamp', 'Instr', 'S#', 'Message'])
 
-	# dictionary mapping serial numbers to Instrument objects ** CHANGE THIS TO ADD MORE INSTRUMENTS **
-	comport_dict = {
-		'FTXP6UA4': AE33_Instrument,
-		'FTXP9NHN': AE16_Instrument,
-		'wchusbserial': ABCD_Instrument,
-		# '142140': ABCD_Instrument,
-		'FT0HCK2R': MA300_Instrument,
-		'FTE4W8JS': LI7000_Instrument, 
-		'FTXP9HEV': LI820_Instrument,
-		'DN03Y92G': SBA5_Instrument,
-		'Vaisala':VCO2_Instrument,
-		'142340':VCO2_Instrument,
-		'141110':VCO2_Instrument,
-		'FTXP9VNO': UCB_Instrument, # CLD64 
-		'FTXPC1N7': CAPS_Instrument,
-		'AH06VSA4': K30_Instrument
-		}
+	# start the raw capture writer before any instrument process is forked
+	raw_writer = r_w.RawWriter(raw_path, format=raw_format)
+	raw_writer.start()
 
 	# Setup signal handler to allow for exiting on Keyboard Interrupt (Ctrl +C)
 	signal.signal(signal.SIGTERM, sig_handler)
 	signal.signal(signal.SIGINT, sig_handler)
 
-	comlist = serial.tools.list_ports.comports()
-	comport_pattern = re.compile('\/dev\/cu\.usbserial(\-(.)*)?$')
-	serial_comlist = []
-
-	# initialize instrument objects for each serial connection (view in terminal with ls /dev/cu.*) that matches 
-	# comport_pattern (/dev/cu.usbserial- or /dev/cu.wchusbsereial for ABCD)
-	for element in comlist:
-		if comport_pattern.match(element.device):
-			try:
-				sn = element.device.split('/dev/cu.usbserial-')[1]
-				comport_dict[sn](sn)
-			except KeyError, IndexError:
-				if element.device == '/dev/cu.usbserial':
-					comport_dict['Vaisala']()
-		elif '/dev/cu.wchusbserial' in element.device:
-			sn = element.device.split('/dev/cu.')[1]
-			comport_dict['wchusbserial'](sn)
-
-	print(('instruments', instruments))
-
-	q.put(('instruments', instruments))
-
-	processes = []
-	for instr in instruments:
-		p = Process(target=instr.run, args=(q,))
-		p.start()
-		processes.append(p)
-
-	while not stop_requested:
-		time.sleep(1)
-
+	# the writer ignores ctrl-c - it stops once everything queued is written
+	try:
+		# initialize instrument objects for each serial connection (view in terminal with ls /dev/cu.*) that matches 
+		# comport_pattern (/dev/cu.usbserial- or /dev/cu.wchusbsereial for ABCD)
+		devices = list_devices()
+		for device in devices:
+			instr = instrument_for_device(device)
+			if instr is not None:
+				attached[device] = instr
+
+		print(('instruments', instruments))
+
+		q.put(('instruments', instruments))
+
+		scheduler = ps.PollScheduler(q)
+		for instr in instruments:
+			if instr.polled:
+				scheduler.add(instr)
+
+		if acquisition != 'mux':
+			for instr in instruments:
+				if not instr.polled:
+					p = Process(target=instr.run, args=(q,))
+					p.start()
+					processes[instr] = p
+			if scheduler.polled:
+				p = Process(target=scheduler.run, args=(lambda: stop_requested,))
+				p.start()
+				for instr in instruments:
+					if instr.polled:
+						processes[instr] = p
+
+		# attach and detach instruments as they are plugged in and removed
+		watcher = pw.PortWatcher(list_devices, attach_device, detach_device, known=devices)
+
+		if acquisition == 'mux':
+			reader = mux.MuxReader(q, scheduler=scheduler, watcher=watcher)
+			for instr in instruments:
+				if not instr.polled:
+					reader.add(instr)
+			reader.run(lambda: stop_requested)
+			if batch_sender is not None:
+				batch_sender.flush()
+		else:
+			while not stop_requested:
+				time.sleep(1)
+				watcher.poll(ps.clock())
+	finally:
+		raw_writer.stop()
 	return
 
 def main():
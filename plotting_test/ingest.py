@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import collections
+import threading
+from datetime import datetime
+from Queue import Empty
+import ipc_batch as ipc
+import timebase as tb
+
+# what to do with new readings when the buffer is full
+POLICIES = ('block', 'drop_oldest', 'coalesce')
+# maxsize of the reading queue under the 'block' policy, so producers block instead of buffering
+QUEUE_BOUND = 10000
+# fraction of capacity a full buffer is coalesced down to, so one pass over it makes room for
+# many readings rather than one
+LOW_WATER = 0.5
+
+# bounded buffer between the reading queue and the plotter
+#
+# a reader thread moves everything sent to QUEUE into a buffer of at most CAPACITY readings, so the
+# queue never backs up while the wx main loop is stalled (a slow draw, a modal dialog), and
+# update_data takes at most FRAME_LIMIT readings per frame. the reader thread is the only one
+# taking from the queue, so the buffer keeps the order things were sent in. when the buffer is full:
+#   'block'       - stop reading the queue, producers block on put once it is full
+#   'drop_oldest' - drop the oldest buffered reading
+#   'coalesce'    - merge buffered readings to one per channel per second (their mean), dropping
+#                   the oldest as well until it is down to LOW_WATER of capacity
+# control messages ('instruments', 'instrument_added', ...) are never dropped. batches from
+# ipc_batch are split into ('rec', chan, value, ts) readings.
+class Ingest(object):
+
+    def __init__(self, queue, policy='coalesce', capacity=50000, frame_limit=5000):
+        if policy not in POLICIES:
+            raise ValueError('policy must be one of %s' % (POLICIES,))
+        self.queue = queue
+        self.policy = policy
+        self.capacity = capacity
+        self.frame_limit = frame_limit
+        self.buffer = collections.deque()
+        # control messages pushed out of the buffer by dropping, delivered before it
+        self.held = []
+        # per channel counts - channel is (name, v_type) for queued readings, chan id for batched ones
+        self.dropped = collections.Counter()
+        self.coalesced = collections.Counter()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        self.fill(block=True)
+
+    # move waiting readings from the queue into the buffer - the reader thread's loop. without BLOCK
+    # this returns as soon as the queue is empty, for running without the thread (tests, tools)
+    def fill(self, block=False):
+        while True:
+            with self.cond:
+                while self.policy == 'block' and len(self.buffer) >= self.capacity:
+                    if not block:
+                        return
+                    self.cond.wait(0.5)
+            try:
+                item = self.queue.get(block, 0.5) if block else self.queue.get(False)
+            except Empty:
+                if block:
+                    continue
+                return
+            with self.cond:
+                self.add(item)
+
+    # caller holds the lock
+    def add(self, item):
+        if item[0] == 'batch':
+            for rec in ipc.unpack(item[1]):
+                self.add_reading(('rec', int(rec['chan']), float(rec['value']), int(rec['ts'])))
+        elif isinstance(item[0], str):
+            self.buffer.append(item)
+        else:
+            self.add_reading(item)
+
+    def add_reading(self, item):
+        if len(self.buffer) >= self.capacity:
+            if self.policy == 'coalesce':
+                self.coalesce()
+                while len(self.buffer) > self.capacity * LOW_WATER:
+                    self.drop_oldest()
+            while len(self.buffer) >= self.capacity and self.policy != 'block':
+                self.drop_oldest()
+        self.buffer.append(item)
+
+    def drop_oldest(self):
+        item = self.buffer.popleft()
+        key = channel(item)
+        if key is None:
+            self.held.append(item)
+        else:
+            self.dropped[key] += 1
+
+    # merge the buffered readings of each channel within the same second into one
+    def coalesce(self):
+        out = []
+        buckets = {}
+        for item in self.buffer:
+            key = channel(item)
+            if key is None:
+                out.append(item)
+                continue
+            value, ts = reading(item)
+            bucket = buckets.get((key, tb.floor_s(ts)))
+            if bucket is None:
+                # [first reading, value sum, count] - a list, unlike every queued item
+                bucket = buckets[(key, tb.floor_s(ts))] = [item, value, 1]
+                out.append(bucket)
+            else:
+                bucket[1] += value
+                bucket[2] += 1
+                self.coalesced[key] += 1
+        self.buffer = collections.deque(merged(x) if isinstance(x, list) else x for x in out)
+
+    # everything to handle this frame, oldest first
+    def drain(self):
+        with self.cond:
+            items = self.held
+            self.held = []
+            for i in range(min(len(self.buffer), self.frame_limit)):
+                items.append(self.buffer.popleft())
+            self.cond.notify_all()
+        return items
+
+    def depth(self):
+        return len(self.buffer)
+
+    def stats(self):
+        with self.cond:
+            return {'depth': len(self.buffer), 'dropped': dict(self.dropped), 'coalesced': dict(self.coalesced)}
+
+# channel of a buffered reading, None for control messages
+def channel(item):
+    if item[0] == 'rec':
+        return item[1]
+    if isinstance(item[0], str):
+        return None
+    return tuple(item[0])
+
+# (value, epoch ns) of a buffered reading
+def reading(item):
+    if item[0] == 'rec':
+        return item[2], item[3]
+    ts = item[1][1]
+    if isinstance(ts, datetime):
+        ts = tb.from_datetime(ts)
+    return item[1][0], ts
+
+# the reading standing in for a coalesced bucket - mean value at the first reading's timestamp
+def merged(bucket):
+    item, total, count = bucket
+    if count == 1:
+        return item
+    if item[0] == 'rec':
+        return ('rec', item[1], total / count, item[3])
+    return (item[0], [total / count] + list(item[1][1:]))
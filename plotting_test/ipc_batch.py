@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import threading
+import time
+import numpy as np
+
+# fixed-layout reading record sent between acquisition and plotter
+# chan - instrument channel id, ts - epoch nanoseconds, value - primary reading
+RECORD = np.dtype([('chan', '<i4'), ('ts', '<f8'), ('value', '<f8')])
+
+# unpack a batch sent by BatchSender into a RECORD array (no copy)
+def unpack(buf):
+	return np.frombuffer(buf, dtype=RECORD)
+
+# groups readings into binary batches and puts them on QUEUE as ('batch', bytes)
+#
+# a batch is sent as soon as it holds MAX_RECORDS readings, and a background thread sends
+# whatever has accumulated every MAX_DELAY seconds so slow instruments aren't held back.
+# create the sender in the process that uses it - the flush thread doesn't survive a fork
+class BatchSender(object):
+
+	def __init__(self, queue, max_records=256, max_delay=0.1):
+		self.queue = queue
+		self.max_records = max_records
+		self.max_delay = max_delay
+		self.records = np.zeros(max_records, dtype=RECORD)
+		self.count = 0
+		self.lock = threading.Lock()
+		self.thread = threading.Thread(target=self.flush_loop)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def add(self, chan, ts, value):
+		with self.lock:
+			self.records[self.count] = (chan, ts, value)
+			self.count += 1
+			if self.count == self.max_records:
+				self.send()
+
+	def flush(self):
+		with self.lock:
+			self.send()
+
+	# caller holds the lock
+	def send(self):
+		if self.count:
+			self.queue.put(('batch', self.records[:self.count].tostring()))
+			self.count = 0
+
+	def flush_loop(self):
+		while True:
+			time.sleep(self.max_delay)
+			self.flush()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import math
+import numpy as np
+
+# table-driven parser for delimited instrument output
+#
+# each instrument states its DELIMITER (a single character, or several characters that
+# are all treated as separators, e.g. '<>' for the LI820 tag format), the FIELDS it reads
+# as (index, divisor) pairs and, for filter-based BC instruments, which of those fields
+# is the attenuation used to correct the first field with CORRECTION.
+#
+# parse() returns the same list the hand-written get_values() used to build:
+# [first field, timestamp, remaining fields...], or None if the line can't be parsed
+class LineParser(object):
+
+	def __init__(self, name, delimiter, fields, attenuation=None, correction=None):
+		self.name = name
+		self.delimiter = delimiter
+		self.fields = list(fields)
+		self.attenuation = attenuation
+		self.correction = correction
+		self.width = max(index for index, divisor in self.fields) + 1
+		self.split = self.compile_split()
+		self.parse = self.compile_parse()
+
+	def __repr__(self):
+		return "LineParser(%s)" % self.name
+
+	# build the function that turns a raw line into its list of fields
+	def compile_split(self):
+		delimiter = self.delimiter
+		if len(delimiter) == 1:
+			def split(line):
+				return line.split('\n')[0].split(delimiter)
+		else:
+			first = delimiter[0]
+			others = delimiter[1:]
+			def split(line):
+				line = line.split('\n')[0]
+				for d in others:
+					line = line.replace(d, first)
+				return line.split(first)
+		return split
+
+	# build the per-line parse function - indices, divisors and the attenuation correction
+	# are bound once here instead of being looked up for every line
+	def compile_parse(self):
+		split = self.split
+		indices = tuple(index for index, divisor in self.fields)
+		divisors = tuple((pos, float(divisor)) for pos, (index, divisor) in enumerate(self.fields) if divisor != 1)
+		atn = self.attenuation
+		corr = self.correction
+		exp = math.exp
+
+		def parse(line, ts):
+			try:
+				v = split(line)
+				values = [float(v[i]) for i in indices]
+			except (ValueError, IndexError):
+				return None
+			for pos, divisor in divisors:
+				values[pos] = values[pos] / divisor
+			if atn is not None:
+				values[0] = values[0] / (exp((-1*values[atn])/100)*corr + (1-corr))
+			values.insert(1, ts)
+			return values
+		return parse
+
+	# bulk mode - parse many buffered LINES in one vectorized pass
+	# returns (ok, values) where OK is a boolean array marking the lines that parsed and
+	# VALUES is an (n, fields) float64 array in the same field order as parse() (without
+	# the timestamp), with NaN rows for lines that failed
+	def parse_many(self, lines):
+		split = self.split
+		rows = [split(line) for line in lines]
+		n = len(rows)
+		values = np.full((n, len(self.fields)), np.nan)
+		ok = np.array([len(row) >= self.width for row in rows], dtype=bool)
+		good = np.flatnonzero(ok)
+		for pos, (index, divisor) in enumerate(self.fields):
+			strs = [rows[i][index] for i in good]
+			try:
+				col = np.array(strs, dtype=float)
+			except ValueError:
+				col = np.array([self.to_float(x) for x in strs], dtype=float)
+				bad = np.isnan(col) & np.array([x.strip().lower() != 'nan' for x in strs], dtype=bool)
+				ok[good[bad]] = False
+			if divisor != 1:
+				col = col / float(divisor)
+			values[good, pos] = col
+		if self.attenuation is not None:
+			corr = self.correction
+			values[:, 0] = values[:, 0] / (np.exp((-1*values[:, self.attenuation])/100)*corr + (1-corr))
+		values[~ok] = np.nan
+		return ok, values
+
+	def to_float(self, x):
+		try:
+			return float(x)
+		except ValueError:
+			return np.nan
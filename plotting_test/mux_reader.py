@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import select
+import sys
+import poll_scheduler as ps
+import telemetry as tm
+
+# services every streaming instrument's serial port from one select() loop in a single process
+#
+# bytes are read as soon as a port is readable, split into lines incrementally per port and
+# every complete line is handed to the instrument's handle_line(), exactly as readline()
+# would have returned it. select() wakes up at least every TIMEOUT seconds so the loop
+# notices a stop request even when no instrument is sending.
+#
+# request/response instruments are serviced by a poll_scheduler.PollScheduler in the same loop,
+# and a port_watcher.PortWatcher is polled from it to attach and detach instruments at runtime
+class MuxReader(object):
+
+	def __init__(self, queue, timeout=0.2, read_size=4096, scheduler=None, watcher=None):
+		self.queue = queue
+		self.scheduler = scheduler
+		self.watcher = watcher
+		self.timeout = timeout
+		self.read_size = read_size
+		# fd -> instrument, fd -> partial line
+		self.readers = {}
+		self.buffers = {}
+
+	def add(self, instr):
+		instr.prepare()
+		fd = instr.serial.fileno()
+		self.readers[fd] = instr
+		self.buffers[fd] = ''
+
+	def remove(self, instr):
+		for fd, i in list(self.readers.items()):
+			if i is instr:
+				del self.readers[fd]
+				del self.buffers[fd]
+
+	# read whatever is waiting on FD and dispatch every complete line - WOKE is when select()
+	# returned, so the recorded latency includes time spent on the other ports first
+	def service(self, fd, woke):
+		instr = self.readers[fd]
+		try:
+			data = os.read(fd, self.read_size)
+		except OSError as e:
+			sys.stdout.write("%s read error, detaching: %s\n" % (instr, e))
+			self.remove(instr)
+			return
+		if not data:
+			# end of file - the port hung up
+			sys.stdout.write("%s hung up, detaching\n" % (instr,))
+			self.remove(instr)
+			return
+		buf = self.buffers[fd] + data
+		lines = buf.split('\n')
+		self.buffers[fd] = lines.pop()
+		for line in lines:
+			values = instr.handle_line(line + '\n')
+			if values is not None:
+				instr.publish(self.queue, values)
+		if lines:
+			tm.registry.get(instr).latency(ps.clock() - woke)
+
+	# run until STOP() returns True, then close every port
+	def run(self, stop):
+		scheduler = self.scheduler
+		while not stop():
+			tm.registry.poll(self.queue)
+			if self.watcher is not None:
+				self.watcher.poll(ps.clock())
+			fds = list(self.readers)
+			timeout = self.timeout
+			if scheduler is not None:
+				now = ps.clock()
+				scheduler.tick(now)
+				fds += scheduler.fds()
+				due = scheduler.next_timeout(now)
+				if due is not None:
+					timeout = min(timeout, due)
+			try:
+				readable, _, _ = select.select(fds, [], [], timeout)
+			except select.error:
+				# interrupted by a signal - re-check STOP
+				continue
+			now = ps.clock()
+			for fd in readable:
+				if fd in self.readers:
+					self.service(fd, now)
+				elif scheduler is not None and fd in scheduler.polled:
+					scheduler.service(fd, now)
+		for instr in self.readers.values():
+			instr.serial.close()
+		if scheduler is not None:
+			for state in scheduler.polled.values():
+				state['instr'].serial.close()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import select
+import sys
+import timebase as tb
+import telemetry as tm
+
+# seconds on the monotonic clock
+def clock():
+	return tb.monotonic_ns() / 1e9
+
+# polls every request/response instrument on its own cadence without sleeping
+#
+# a request is written to each polled instrument every INTERVAL seconds (or the instrument's
+# poll_interval). at most one request is outstanding per port, so whatever the port sends
+# back is the response to it - responses are matched as bytes arrive and a request that
+# isn't answered within TIMEOUT seconds is counted and re-issued on the next cadence.
+# achieved poll rate and response latency are kept per instrument.
+#
+# the scheduler can run inside MuxReader's select loop or on its own with run()
+class PollScheduler(object):
+
+	def __init__(self, queue, interval=0.5, timeout=1.0, read_size=256, report_interval=30):
+		self.queue = queue
+		self.interval = interval
+		self.timeout = timeout
+		self.read_size = read_size
+		self.report_interval = report_interval
+		self.last_report = clock()
+		# fd -> per instrument poll state
+		self.polled = {}
+
+	def add(self, instr):
+		now = clock()
+		self.polled[instr.serial.fileno()] = {
+			'instr': instr,
+			'interval': instr.poll_interval or self.interval,
+			'buffer': '',
+			'sent': None,
+			'next': now,
+			'started': now,
+			'responses': 0,
+			'timeouts': 0,
+			'unsolicited': 0,
+			'latency_sum': 0.0,
+			'latency_max': 0.0,
+			'latency_last': None,
+		}
+
+	def remove(self, instr):
+		for fd, state in list(self.polled.items()):
+			if state['instr'] is instr:
+				del self.polled[fd]
+
+	def fds(self):
+		return list(self.polled)
+
+	# write requests that are due and expire unanswered ones
+	def tick(self, now):
+		for state in list(self.polled.values()):
+			if state['sent'] is not None and now - state['sent'] > self.timeout:
+				state['timeouts'] += 1
+				tm.registry.get(state['instr']).timeouts += 1
+				state['sent'] = None
+			if state['sent'] is None and now >= state['next']:
+				state['buffer'] = ''
+				try:
+					state['instr'].serial.write(state['instr'].poll_request)
+				except (OSError, IOError) as e:
+					sys.stdout.write("%s write error, detaching: %s\n" % (state['instr'], e))
+					self.remove(state['instr'])
+					continue
+				state['sent'] = now
+				# keep an even cadence, but don't try to catch up after a stall
+				state['next'] = max(state['next'] + state['interval'], now)
+		if self.report_interval and now - self.last_report >= self.report_interval:
+			self.report()
+			self.last_report = now
+
+	# seconds until the next request or timeout is due
+	def next_timeout(self, now):
+		due = []
+		for state in self.polled.values():
+			if state['sent'] is None:
+				due.append(state['next'])
+			else:
+				due.append(state['sent'] + self.timeout)
+		if not due:
+			return None
+		return max(min(due) - now, 0)
+
+	# read a response from FD and hand it to the instrument
+	def service(self, fd, now):
+		state = self.polled[fd]
+		instr = state['instr']
+		try:
+			data = os.read(fd, self.read_size)
+		except OSError as e:
+			sys.stdout.write("%s read error, detaching: %s\n" % (instr, e))
+			self.remove(instr)
+			return
+		if not data:
+			# end of file - the port hung up
+			sys.stdout.write("%s closed, detaching\n" % (instr,))
+			self.remove(instr)
+			return
+		state['buffer'] += data
+		while True:
+			resp, state['buffer'] = instr.split_response(state['buffer'])
+			if resp is None:
+				break
+			if state['sent'] is not None:
+				latency = now - state['sent']
+				state['responses'] += 1
+				state['latency_sum'] += latency
+				state['latency_max'] = max(state['latency_max'], latency)
+				state['latency_last'] = latency
+				tm.registry.get(instr).latency(latency)
+				state['sent'] = None
+			else:
+				state['unsolicited'] += 1
+			values = instr.handle_line(resp)
+			if values is not None:
+				instr.publish(self.queue, values)
+
+	# per instrument poll rate (responses/sec) and response latency (seconds)
+	def stats(self):
+		now = clock()
+		ret = {}
+		for state in self.polled.values():
+			elapsed = max(now - state['started'], 1e-9)
+			responses = state['responses']
+			ret[str(state['instr'])] = {
+				'poll_rate': responses / elapsed,
+				'latency_mean': state['latency_sum'] / responses if responses else None,
+				'latency_max': state['latency_max'],
+				'latency_last': state['latency_last'],
+				'timeouts': state['timeouts'],
+				'unsolicited': state['unsolicited'],
+			}
+		return ret
+
+	def report(self):
+		for name, s in sorted(self.stats().items()):
+			latency = '%.1f ms' % (s['latency_mean'] * 1000) if s['latency_mean'] is not None else 'n/a'
+			sys.stdout.write("%s: %.2f polls/sec, mean latency %s, %d timeouts\n" % (name, s['poll_rate'], latency, s['timeouts']))
+		sys.stdout.flush()
+
+	# standalone loop for when the scheduler isn't run by MuxReader
+	def run(self, stop):
+		while not stop():
+			tm.registry.poll(self.queue)
+			now = clock()
+			self.tick(now)
+			timeout = self.next_timeout(now)
+			try:
+				readable, _, _ = select.select(self.fds(), [], [], 0.2 if timeout is None else min(timeout, 0.2))
+			except select.error:
+				continue
+			now = clock()
+			for fd in readable:
+				if fd in self.polled:
+					self.service(fd, now)
+		for state in self.polled.values():
+			state['instr'].serial.close()
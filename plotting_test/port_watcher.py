@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import sys
+
+# watches the serial ports for instruments being plugged in or removed while acquisition runs
+#
+# every INTERVAL seconds the current device list (LIST_DEVICES()) is diffed against the last one
+# and ATTACH(device) / DETACH(device) are called for the changes. a device that re-enumerates
+# after a usb glitch shows up as a detach followed by an attach. the check is a plain interval
+# diff - cheap enough to run from the acquisition loop itself, and it works on macOS where there
+# is no inotify for /dev
+class PortWatcher(object):
+
+	def __init__(self, list_devices, attach, detach, interval=2.0, known=None):
+		self.list_devices = list_devices
+		self.attach = attach
+		self.detach = detach
+		self.interval = interval
+		self.known = set(known if known is not None else list_devices())
+		self.next_check = None
+
+	# check for changes if INTERVAL has passed since the last check (NOW in seconds)
+	def poll(self, now):
+		if self.next_check is None or now >= self.next_check:
+			self.next_check = now + self.interval
+			self.check()
+
+	def check(self):
+		try:
+			current = set(self.list_devices())
+		except (OSError, IOError) as e:
+			sys.stdout.write("port watcher: could not list devices: %s\n" % e)
+			return
+		for device in sorted(self.known - current):
+			self.detach(device)
+		for device in sorted(current - self.known):
+			self.attach(device)
+		self.known = current
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import csv
+import os
+import struct
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+import numpy as np
+import timebase as tb
+
+# binary raw capture - the compact alternative to rawraw_data.csv
+#
+# the capture file is MAGIC followed by length-prefixed records: RECORD (payload length, epoch ns,
+# instrument id) and the serial output exactly as received. the first time an instrument is seen a
+# declaration record (id DECLARE_ID, payload 'id,name,sn') is written ahead of its data, so the file
+# is self-describing and can be appended to and read while it grows.
+#
+# <capture>.idx is a sparse index of fixed INDEX entries (epoch ns, file offset) - one at the first
+# record of every INDEX_INTERVAL seconds, plus one per declaration with ts DECLARATION - so a reader
+# can seek to a time range without scanning the file. it can be rebuilt from the capture with
+# build_index().
+
+MAGIC = 'PLRAW\x01\n\x00'
+RECORD = struct.Struct('<IqH')
+INDEX = np.dtype([('ts', '<i8'), ('offset', '<u8')])
+DECLARE_ID = 0xFFFF
+DECLARATION = -1
+INDEX_INTERVAL = 10
+# records are written in arrival order, which can trail the timestamp order by this many seconds
+SEEK_SLACK = 5
+
+class CaptureWriter(object):
+
+	def __init__(self, path, index_interval=INDEX_INTERVAL):
+		self.path = path
+		self.step = index_interval * tb.NS
+		self.ids = {}
+		self.next_index = None
+		if os.path.exists(path) and os.path.getsize(path):
+			# reopened capture - carry on with the instrument ids already declared
+			for iid, (name, sn) in read_declarations(path).items():
+				self.ids[(name, sn)] = iid
+			self.offset = os.path.getsize(path)
+			self.file = open(path, 'ab')
+		else:
+			self.file = open(path, 'wb')
+			self.file.write(MAGIC)
+			self.offset = len(MAGIC)
+		self.index = open(path + '.idx', 'ab')
+
+	# write serial output PAYLOAD of instrument NAME/SN received at epoch ns TS
+	def write(self, ts, name, sn, payload):
+		iid = self.ids.get((name, sn))
+		if iid is None:
+			iid = self.declare(ts, name, sn)
+		if self.next_index is None or ts >= self.next_index:
+			self.index.write(struct.pack('<qQ', ts, self.offset))
+			self.next_index = (ts // self.step + 1) * self.step
+		self.record(ts, iid, payload)
+
+	# BATCH of (ts, name, sn, payload), as queued by raw_writer.RawWriter
+	def write_many(self, batch):
+		for ts, name, sn, payload in batch:
+			self.write(ts, name, sn, payload)
+
+	def declare(self, ts, name, sn):
+		iid = len(self.ids)
+		self.ids[(name, sn)] = iid
+		self.index.write(struct.pack('<qQ', DECLARATION, self.offset))
+		self.record(ts, DECLARE_ID, '%d,%s,%s' % (iid, name, sn))
+		return iid
+
+	def record(self, ts, iid, payload):
+		self.file.write(RECORD.pack(len(payload), ts, iid))
+		self.file.write(payload)
+		self.offset += RECORD.size + len(payload)
+
+	def tell(self):
+		return self.offset
+
+	def flush(self, fsync=False):
+		self.file.flush()
+		self.index.flush()
+		if fsync:
+			os.fsync(self.file.fileno())
+			os.fsync(self.index.fileno())
+
+	def close(self):
+		self.file.close()
+		self.index.close()
+
+# read records from open file F at its current position - yields (offset, ts, instrument id, payload)
+# and stops at the end of the file or at a record that is still being written
+def read_records(f):
+	offset = f.tell()
+	while True:
+		head = f.read(RECORD.size)
+		if len(head) < RECORD.size:
+			return
+		length, ts, iid = RECORD.unpack(head)
+		payload = f.read(length)
+		if len(payload) < length:
+			return
+		yield offset, ts, iid, payload
+		offset += RECORD.size + length
+
+def parse_declaration(payload):
+	iid, name, sn = payload.split(',', 2)
+	return int(iid), name, sn
+
+def open_capture(path):
+	f = open(path, 'rb')
+	if f.read(len(MAGIC)) != MAGIC:
+		f.close()
+		raise ValueError('%s is not a raw capture file' % path)
+	return f
+
+def load_index(path):
+	if not os.path.exists(path + '.idx'):
+		build_index(path)
+	with open(path + '.idx', 'rb') as f:
+		data = f.read()
+	# leave out a partially written last entry
+	return np.frombuffer(data[:len(data) - len(data) % INDEX.itemsize], dtype=INDEX)
+
+# instrument id -> (name, sn) declared in capture PATH
+def read_declarations(path):
+	ret = {}
+	index = load_index(path)
+	with open_capture(path) as f:
+		for offset in index['offset'][index['ts'] == DECLARATION]:
+			f.seek(offset)
+			for offset, ts, iid, payload in read_records(f):
+				i, name, sn = parse_declaration(payload)
+				ret[i] = (name, sn)
+				break
+	return ret
+
+# (re)write PATH.idx by scanning the capture
+def build_index(path, index_interval=INDEX_INTERVAL):
+	step = index_interval * tb.NS
+	next_index = None
+	entries = []
+	with open_capture(path) as f:
+		for offset, ts, iid, payload in read_records(f):
+			if iid == DECLARE_ID:
+				entries.append((DECLARATION, offset))
+			elif next_index is None or ts >= next_index:
+				entries.append((ts, offset))
+				next_index = (ts // step + 1) * step
+	np.array(entries, dtype=INDEX).tofile(path + '.idx')
+
+# reads a capture back, seeking to a time range through the index
+class CaptureReader(object):
+
+	def __init__(self, path):
+		self.path = path
+		index = load_index(path)
+		self.times = index[index['ts'] != DECLARATION]
+		self.instruments = read_declarations(path)
+
+	# (ts, name, sn, payload) for records with START <= ts < END (epoch ns, None = open ended)
+	def records(self, start=None, end=None):
+		with open_capture(self.path) as f:
+			if start is not None:
+				i = np.searchsorted(self.times['ts'], start - SEEK_SLACK * tb.NS, side='right') - 1
+				if i >= 0:
+					f.seek(self.times['offset'][i])
+			for offset, ts, iid, payload in read_records(f):
+				if iid == DECLARE_ID:
+					i, name, sn = parse_declaration(payload)
+					self.instruments[i] = (name, sn)
+					continue
+				if end is not None and ts >= end:
+					if ts >= end + SEEK_SLACK * tb.NS:
+						return
+					continue
+				if start is not None and ts < start:
+					continue
+				name, sn = self.instruments[iid]
+				yield ts, name, sn, payload
+
+	# run the records through PARSERS (instrument name -> parser, e.g. data_ac.parsers) - yields
+	# (name, sn, values) for every record that parses
+	def parse(self, parsers, start=None, end=None):
+		for ts, name, sn, payload in self.records(start, end):
+			parser = parsers.get(name)
+			if parser is None:
+				continue
+			values = parser.parse(payload, ts)
+			if values is not None:
+				yield name, sn, values
+
+def parse_time(s):
+	return tb.from_datetime(datetime.strptime(s, '%Y-%m-%d %H:%M:%S'))
+
+# convert a capture (or a time range of it) to rawraw_data.csv rows
+if __name__ == '__main__':
+	parser = ArgumentParser()
+	parser.add_argument("capture", help="binary raw capture (rawraw_data.bin)")
+	parser.add_argument("csv", help="rawraw_data.csv to write")
+	parser.add_argument("--start", type=parse_time, help="first time to convert (YYYY-mm-dd HH:MM:SS)")
+	parser.add_argument("--end", type=parse_time, help="time to stop converting at (YYYY-mm-dd HH:MM:SS)")
+	args = parser.parse_args()
+
+	reader = CaptureReader(args.capture)
+	with open(args.csv, mode='wb') as rawFile:
+		rawData = csv.writer(rawFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+		rawData.writerow(['Timestamp', 'Instr', 'S#', 'Message'])
+		count = 0
+		for ts, name, sn, payload in reader.records(args.start, args.end):
+			rawData.writerow([tb.to_datetime(ts), name, sn, payload])
+			count += 1
+	sys.stdout.write("%d records written to %s\n" % (count, args.csv))
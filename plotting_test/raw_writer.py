@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import csv
+import os
+import signal
+import sys
+import time
+from multiprocessing import Process, Queue, Value
+from Queue import Empty
+import timebase as tb
+import raw_capture as rc
+
+# durability settings - 'none' leaves flushing to the os, 'flush' flushes python buffers
+# after every batch, 'fsync' also forces every batch to disk
+DURABILITY = ('none', 'flush', 'fsync')
+# 'csv' writes rawraw_data.csv rows, 'binary' a raw_capture.CaptureWriter framed log and index
+FORMATS = ('csv', 'binary')
+
+# rawraw_data.csv with the same interface as raw_capture.CaptureWriter
+class CSVCapture(object):
+
+	def __init__(self, path):
+		self.file = open(path, mode='ab')
+		self.writer = csv.writer(self.file, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+
+	def write_many(self, batch):
+		self.writer.writerows([(tb.to_datetime(ts), name, sn, ser) for ts, name, sn, ser in batch])
+
+	def tell(self):
+		return self.file.tell()
+
+	def flush(self, fsync=False):
+		self.file.flush()
+		if fsync:
+			os.fsync(self.file.fileno())
+
+	def close(self):
+		self.file.close()
+
+# dedicated writer process for rawraw_data.csv - instruments hand lines to PUT and the
+# writer keeps the file open, writing in batches of up to BATCH_SIZE lines or every
+# FLUSH_INTERVAL seconds, whichever comes first
+class RawWriter(object):
+
+	def __init__(self, path, flush_interval=0.5, batch_size=500, durability='flush', report_interval=10, format='csv'):
+		if durability not in DURABILITY:
+			raise ValueError('durability must be one of %s' % (DURABILITY,))
+		if format not in FORMATS:
+			raise ValueError('format must be one of %s' % (FORMATS,))
+		self.path = path
+		self.format = format
+		self.flush_interval = flush_interval
+		self.batch_size = batch_size
+		self.durability = durability
+		self.report_interval = report_interval
+		self.queue = Queue()
+		# shared counters so any process holding the writer can read its stats
+		self.enqueued = Value('L', 0)
+		self.written = Value('L', 0)
+		self.bytes_per_sec = Value('d', 0.0)
+		self.process = None
+
+	def start(self):
+		self.process = Process(target=self.run)
+		self.process.daemon = True
+		self.process.start()
+
+	# hand the serial output SER of instrument NAME/SN, received at epoch nanoseconds TS, to the writer
+	def put(self, ts, name, sn, ser):
+		with self.enqueued.get_lock():
+			self.enqueued.value += 1
+		self.queue.put((ts, name, sn, ser))
+
+	# number of lines handed to the writer but not yet written
+	def queue_depth(self):
+		return self.enqueued.value - self.written.value
+
+	def stats(self):
+		return {'queue_depth': self.queue_depth(), 'written': self.written.value, 'bytes_per_sec': self.bytes_per_sec.value}
+
+	# write everything still queued and stop the writer process
+	def stop(self, timeout=5):
+		self.queue.put(None)
+		if self.process is not None:
+			self.process.join(timeout)
+
+	def run(self):
+		# a ctrl-c reaches the whole process group - the writer keeps going until stop() so that
+		# everything queued gets written
+		signal.signal(signal.SIGINT, signal.SIG_IGN)
+		signal.signal(signal.SIGTERM, signal.SIG_IGN)
+		if self.format == 'binary':
+			capture = rc.CaptureWriter(self.path)
+		else:
+			capture = CSVCapture(self.path)
+		last_report = time.time()
+		last_bytes = capture.tell()
+		running = True
+		while running:
+			batch = []
+			deadline = time.time() + self.flush_interval
+			while len(batch) < self.batch_size:
+				try:
+					item = self.queue.get(timeout=max(deadline - time.time(), 0))
+				except Empty:
+					break
+				if item is None:
+					running = False
+					break
+				batch.append(item)
+			if batch:
+				capture.write_many(batch)
+				if self.durability != 'none':
+					capture.flush(self.durability == 'fsync')
+				with self.written.get_lock():
+					self.written.value += len(batch)
+			now = time.time()
+			if now - last_report >= (self.report_interval or self.flush_interval):
+				capture.flush()
+				position = capture.tell()
+				self.bytes_per_sec.value = (position - last_bytes) / (now - last_report)
+				last_bytes = position
+				last_report = now
+				if self.report_interval:
+					self.report()
+		capture.flush(self.durability == 'fsync')
+		capture.close()
+
+	def report(self):
+		sys.stdout.write("raw writer: queue depth %d, %.1f bytes/sec\n" % (self.queue_depth(), self.bytes_per_sec.value))
+		sys.stdout.flush()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import collections
+import csv
+import os
+import sys
+import time
+from argparse import ArgumentParser
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+import data_ac as d_ac
+import raw_capture as rc
+import timebase as tb
+
+# raw captures rows per task
+CHUNK = 20000
+
+# regenerates raw_data.csv from a raw capture (rawraw_data.csv or rawraw_data.bin), e.g. after a
+# parser fix
+#
+# the capture is read in CHUNK-row pieces, which worker processes run through the instruments' own
+# parsers (data_ac.parsers) - the code used live - keeping the capture's timestamps. the pieces
+# are written back in capture order, so the file comes out as it would have been written live
+# with the fixed parsers, except that rows aren't re-sorted within a plotter frame.
+
+# (timestamp, name, sn, payload) rows of capture PATH
+def capture_rows(path):
+	with open(path, 'rb') as f:
+		binary = f.read(len(rc.MAGIC)) == rc.MAGIC
+	if binary:
+		for ts, name, sn, payload in rc.CaptureReader(path).records():
+			yield str(tb.to_datetime(ts)), name, sn, payload
+	else:
+		with open(path, 'rb') as f:
+			reader = csv.reader(f, delimiter=',')
+			next(reader)
+			for row in reader:
+				yield tuple(row)
+
+# raw_data.csv rows for capture ROWS - returns them with per-instrument (lines, failures) counts
+#
+# the lines of each instrument with a LineParser are parsed together with its bulk parse_many,
+# the others line by line. the rows come back in capture order either way
+def parse_chunk(rows):
+	out = [None] * len(rows)
+	counts = collections.defaultdict(lambda: [0, 0])
+	# name -> positions of its lines in ROWS
+	lines = collections.defaultdict(list)
+	for i, (ts, name, sn, payload) in enumerate(rows):
+		lines[name].append(i)
+	for name, positions in lines.items():
+		counts[name][0] += len(positions)
+		parser = d_ac.parsers.get(name)
+		if parser is None:
+			continue
+		if hasattr(parser, 'parse_many'):
+			ok, values = parser.parse_many([rows[i][3] for i in positions])
+			for i, parsed, value in zip(positions, ok.tolist(), values[:, 0].tolist()):
+				if parsed:
+					out[i] = [rows[i][0], name, d_ac.channels[name], value]
+		else:
+			for i in positions:
+				values = parser.parse(rows[i][3], rows[i][0])
+				if values is not None:
+					out[i] = [rows[i][0], name, d_ac.channels[name], values[0]]
+	for i, row in enumerate(out):
+		if row is None:
+			counts[rows[i][1]][1] += 1
+	return [row for row in out if row is not None], dict(counts)
+
+def chunks(rows, size):
+	while True:
+		chunk = list(islice(rows, size))
+		if not chunk:
+			return
+		yield chunk
+
+# instruments.csv for the instruments in COUNTS, in the plotter's channel order
+def write_instruments(path, counts):
+	with open(path, mode='wb') as instrFile:
+		writer = csv.writer(instrFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+		writer.writerow(['Instr ID', 'Channel'])
+		for channel in ('CO2', 'NOX', 'BC'):
+			for name in counts:
+				if d_ac.channels.get(name) == channel:
+					writer.writerow([name, channel])
+
+# re-parse CAPTURE into raw_data.csv OUT with WORKERS processes
+def reparse(capture, out, workers=None, size=CHUNK):
+	workers = workers or cpu_count()
+	started = time.time()
+	# name -> [lines, failures], in the order instruments first appear
+	counts = collections.OrderedDict()
+	written = 0
+	pool = Pool(workers)
+	try:
+		with open(out, mode='wb') as plotFile:
+			writer = csv.writer(plotFile, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+			writer.writerow(['Timestamp', 'Instr ID', 'Channel', 'Value'])
+			# imap hands the chunks back in capture order, however the workers finish
+			for i, (rows, chunk_counts) in enumerate(pool.imap(parse_chunk, chunks(capture_rows(capture), size))):
+				writer.writerows(rows)
+				written += len(rows)
+				for name, (lines, failures) in chunk_counts.items():
+					c = counts.setdefault(name, [0, 0])
+					c[0] += lines
+					c[1] += failures
+				lines = sum(c[0] for c in counts.values())
+				sys.stdout.write("%d lines, %d rows (%d lines/sec)\n" % (lines, written, lines / max(time.time() - started, 1e-3)))
+				sys.stdout.flush()
+	finally:
+		pool.close()
+		pool.join()
+
+	instr_path = os.path.join(os.path.dirname(os.path.abspath(out)), 'instruments.csv')
+	if not os.path.exists(instr_path):
+		write_instruments(instr_path, counts)
+
+	elapsed = time.time() - started
+	for name, (lines, failures) in counts.items():
+		note = '' if name in d_ac.parsers else ' (no parser)'
+		sys.stdout.write("%s: %d lines, %d failed to parse%s\n" % (name, lines, failures, note))
+	sys.stdout.write("%d rows written to %s in %.1fs\n" % (written, out, elapsed))
+	sys.stdout.flush()
+
+if __name__ == '__main__':
+	parser = ArgumentParser()
+	parser.add_argument("capture", help="raw capture (rawraw_data.csv or rawraw_data.bin)")
+	parser.add_argument("csv", help="raw_data.csv to write")
+	parser.add_argument("-j", "--workers", type=int, help="worker processes (one per cpu by default)")
+	parser.add_argument("--chunk", type=int, default=CHUNK, help="capture rows per task")
+	args = parser.parse_args()
+
+	reparse(args.capture, args.csv, args.workers, args.chunk)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import csv
+import os
+import sys
+from datetime import datetime, timedelta
+import numpy as np
+import timebase as tb
+
+# campaign files parsed once into numpy arrays and cached next to the source as <file>.npz
+#
+# timestamps are int64 ns on the recording's own (naive, local) clock - datetime64 nanoseconds,
+# not epoch time - and values are float64 with NaN where a row is empty or not a number. a cache is
+# used only while the source's mtime and size match the ones it was built from.
+#
+# some exports only kept minutes and seconds ('%M:%S.%f'). those files are cached 'relative' - ns
+# into the hour their first row was in, an hour added every time the minutes wrap around - and
+# placed on the clock by load() given the campaign's ANCHOR (first full timestamp).
+#
+# files replayed row by row (raw_data.csv) get a per-minute byte offset index instead, cached as
+# <file>.idx.npz, so a replay can seek straight to its start time.
+
+MINUTE = 60 * tb.NS
+HOUR = 3600 * tb.NS
+
+def cache_path(path):
+	return path + '.npz'
+
+# parse a campaign file - (timestamps, values, relative)
+def parse(path):
+	with open(path) as csv_file:
+		csv_reader = csv.reader(csv_file, delimiter=',')
+		next(csv_reader)
+		rows = [(item[0], item[2]) for item in csv_reader]
+	if not rows:
+		return np.zeros(0, dtype=np.int64), np.zeros(0), False
+	times, values = [np.array(x) for x in zip(*rows)]
+	relative = '-' not in times[0]
+	if relative:
+		parts = np.char.partition(times, ':')
+		ts = parts[:, 0].astype(np.int64) * 60 * tb.NS + np.round(parts[:, 2].astype(float) * 1e6).astype(np.int64) * 1000
+		# an hour passed every time the minutes go back more than half an hour
+		wraps = np.concatenate([[0], np.cumsum(np.diff(ts) < -HOUR / 2)])
+		ts = ts + wraps * HOUR
+	else:
+		ts = times.astype('datetime64[ns]').astype(np.int64)
+	return ts, parse_values(values), relative
+
+def parse_values(values):
+	try:
+		return np.where(values == '', 'nan', values).astype(float)
+	except ValueError:
+		ret = np.empty(len(values))
+		for i, v in enumerate(values):
+			try:
+				ret[i] = float(v)
+			except ValueError:
+				ret[i] = np.nan
+		return ret
+
+# arrays BUILD(PATH) makes from file PATH, from the cache PATH + SUFFIX when that is still current
+def cached(path, suffix, build):
+	stat = os.stat(path)
+	cache = path + suffix
+	if os.path.exists(cache):
+		try:
+			with np.load(cache) as npz:
+				if npz['mtime'] == stat.st_mtime and npz['size'] == stat.st_size:
+					return dict(npz.items())
+		except (IOError, ValueError, KeyError):
+			pass
+	arrays = build(path)
+	try:
+		tmp = cache + '.tmp'
+		with open(tmp, 'wb') as f:
+			np.savez(f, mtime=stat.st_mtime, size=stat.st_size, **arrays)
+		os.rename(tmp, cache)
+	except (IOError, OSError) as e:
+		# read-only campaign (e.g. bundled with the app) - parse again next time
+		sys.stdout.write("could not cache %s: %s\n" % (path, e))
+	return arrays
+
+# (timestamps, values, relative) of PATH
+def load_raw(path):
+	arrays = cached(path, '.npz', lambda path: dict(zip(('ts', 'values', 'relative'), parse(path))))
+	return arrays['ts'], arrays['values'], bool(arrays['relative'])
+
+# first full timestamp in any of PATHS - anchors the files that only kept minutes and seconds
+def find_anchor(paths):
+	for path in paths:
+		ts, values, relative = load_raw(path)
+		if not relative and len(ts):
+			return ts[0]
+	return 0
+
+# (timestamps, values) of campaign file PATH on the recording clock
+def load(path, anchor=0):
+	ts, values, relative = load_raw(path)
+	if relative and len(ts):
+		hour = anchor - anchor % HOUR
+		# a file starting just after the hour turned
+		if hour + ts[0] < anchor - HOUR / 2:
+			hour += HOUR
+		ts = ts + hour
+	return ts, values
+
+# recording clock ns of the naive datetime DT
+def recording_ns(dt):
+	return int(np.datetime64(dt, 'ns').astype(np.int64))
+
+# naive datetime of recording clock ns TS
+def recording_datetime(ts):
+	return datetime(1970, 1, 1) + timedelta(microseconds=int(ts) // 1000)
+
+# rows [i, j) of TS (recording clock ns) that fall in START <= ts < END (None = open ended) - a row
+# stamped before the one ahead of it stays with that row
+def span(ts, start=None, end=None):
+	ts = np.maximum.accumulate(ts)
+	i = np.searchsorted(ts, start) if start is not None else 0
+	j = np.searchsorted(ts, end) if end is not None else len(ts)
+	return i, j
+
+# per-minute index of a csv with a full timestamp in the first column (raw_data.csv) - (minute,
+# byte offset of the first row in it) in recording clock ns, for seeking to a time without reading
+# the rows before it
+def build_minute_index(path):
+	minutes = []
+	offsets = []
+	with open(path, 'rb') as f:
+		offset = len(f.readline())
+		for line in f:
+			# 'YYYY-mm-dd HH:MM'
+			minute = line[:16]
+			if not minutes or minute > minutes[-1]:
+				minutes.append(minute)
+				offsets.append(offset)
+			offset += len(line)
+	return {'minutes': np.array(minutes).astype('datetime64[ns]').astype(np.int64), 'offsets': np.array(offsets, dtype=np.uint64)}
+
+def minute_index(path):
+	arrays = cached(path, '.idx.npz', build_minute_index)
+	return arrays['minutes'], arrays['offsets']
+
+# move open csv file F (at PATH) to a row shortly before recording clock ns START - rows are written
+# in arrival order, so this is a minute early and the caller skips whatever is still before START
+def seek(f, path, start):
+	minutes, offsets = minute_index(path)
+	i = np.searchsorted(minutes, start - start % MINUTE - MINUTE, side='right') - 1
+	if i >= 0:
+		f.seek(int(offsets[i]))
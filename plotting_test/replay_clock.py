@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import ctypes
+import time
+from multiprocessing import Value
+import timebase as tb
+
+# speed of a replay that runs as fast as the plotter can analyse it
+UNLIMITED = None
+
+# clock shared by the replay senders (co2/nox/bc, reup_raw) and the plotter
+#
+# a recorded reading is stamped with the replay's origin plus its offset into the recording (at)
+# and handed to the plotter once the clock reaches that time (wait_until). the plotter takes "now"
+# from the same clock, so its analysis horizons hold in replayed time.
+#
+# with a SPEED factor the clock runs SPEED times as fast as the wall clock. an UNLIMITED replay is
+# stepped by the plotter instead - the clock only moves STEP seconds when a frame is done
+# (advance), so the senders never get ahead of what has been analysed.
+#
+# create the clock before the senders are forked - its state is in shared memory
+class ReplayClock(object):
+
+	def __init__(self, speed=1.0, step=1.0):
+		if not speed or speed <= 0:
+			speed = UNLIMITED
+		self.speed = speed
+		self.step = int(step * tb.NS)
+		# epoch ns the recording is mapped to, and the monotonic ns it was mapped at
+		self.origin = Value(ctypes.c_int64, tb.now_ns(), lock=False)
+		self.origin_mono = Value(ctypes.c_int64, tb.monotonic_ns(), lock=False)
+		# current time of an UNLIMITED replay
+		self.sim_now = Value(ctypes.c_int64, self.origin.value, lock=False)
+
+	# analysis frame interval (ms) for the plotter - an unlimited replay runs frames back to back
+	@property
+	def frame_interval(self):
+		return 1 if self.speed is UNLIMITED else 200
+
+	def now_ns(self):
+		if self.speed is UNLIMITED:
+			return self.sim_now.value
+		return self.origin.value + int((tb.monotonic_ns() - self.origin_mono.value) * self.speed)
+
+	# epoch ns of the reading OFFSET (timedelta) into the recording
+	def at(self, offset):
+		return self.origin.value + (offset.days * 86400 + offset.seconds) * tb.NS + offset.microseconds * 1000
+
+	# block until the clock reaches epoch ns TS
+	def wait_until(self, ts):
+		while True:
+			remaining = ts - self.now_ns()
+			if remaining <= 0:
+				return
+			if self.speed is UNLIMITED:
+				time.sleep(0.001)
+			else:
+				time.sleep(remaining / 1e9 / self.speed)
+
+	# the plotter finished a frame - move an unlimited replay on by STEP
+	def advance(self):
+		if self.speed is UNLIMITED:
+			self.sim_now.value += self.step
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import sys
+from datetime import timedelta
+import numpy as np
+import ipc_batch as ipc
+import replay_cache as cache
+import replay_clock as rcl
+
+# campaign replayed in test mode - (file, channel, rows skipped at the start)
+CAMPAIGN = 'Trapac_2019_Day5'
+CAMPAIGN_FILES = [
+	('LI7000-1-CO2-nan.csv', 'CO2', 1550),
+	('LI820-1-CO2-nan.csv', 'CO2', 1550),
+	('SBA5-1-CO2-nan.csv', 'CO2', 1550),
+	('Vaisala-1-CO2-nan.csv', 'CO2', 1550),
+	('CLD64-1-NOx-nan.csv', 'NOX', 400),
+	('CAPS-1-NO2-nan.csv', 'NOX', 400),
+	('AE33-1-BC-nan.csv', 'BC', 360),
+	('MA300-1-BC-nan.csv', 'BC', 360),
+	]
+
+class Instrument(object):
+	def __init__(self, name, v_type, chan_id=None):
+		self.name = name
+		self.v_type = v_type
+		# channel id used by the binary transports
+		self.chan_id = chan_id
+
+	def __str__(self):
+		return "%s %s Instrument" % (self.name, self.v_type)
+
+	def __repr__(self):
+		return self.__str__()
+
+def campaign_dir(campaign=CAMPAIGN):
+	if getattr(sys, 'frozen', False):
+		__location__ = sys._MEIPASS
+	else:
+		__location__ = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
+	return os.path.join(__location__, '..', 'plume_results', campaign)
+
+# (Instrument, path, rows skipped) for the campaign files of channel V_TYPE (every file if None) -
+# channel ids are the file's position in CAMPAIGN_FILES, so they match instruments()
+def campaign_files(v_type=None, campaign=CAMPAIGN):
+	files = []
+	for chan_id, (f, vt, skip) in enumerate(CAMPAIGN_FILES):
+		if v_type is None or vt == v_type:
+			files.append((Instrument(f.split('-')[0], vt, chan_id), os.path.join(campaign_dir(campaign), f), skip))
+	return files
+
+def instruments(campaign=CAMPAIGN):
+	return [instr for instr, path, skip in campaign_files(None, campaign)]
+
+# replays campaign files to the plotter from one thread
+#
+# the files are loaded through replay_cache and merged into one stream by timestamp up front -
+# ties go to the file listed first and a file's own rows keep their order, so every run sends the
+# same readings in the same order. whatever is due is sent as one ('batch', records) every INTERVAL
+# seconds of replay time.
+#
+# given a START (and END) datetime, every file is cut to that part of the recording and START is
+# mapped to the start of the replay CLOCK. without one, each file skips the rows given in
+# CAMPAIGN_FILES and its first row left is mapped to the start of the clock.
+class ReplayEngine(object):
+
+	def __init__(self, queue, files, clock=None, interval=0.2, start=None, end=None):
+		self.queue = queue
+		self.files = files
+		self.clock = clock if clock is not None else rcl.ReplayClock()
+		self.interval = int(interval * 1e9)
+		self.start = cache.recording_ns(start) if start is not None else None
+		self.end = cache.recording_ns(end) if end is not None else None
+
+	# the campaign as one RECORD array in send order, with its timestamps stamped on the clock
+	def merge(self):
+		anchor = cache.find_anchor([path for instr, path, skip in self.files])
+		origin = self.clock.at(timedelta(0))
+		parts = []
+		keys = []
+		for i, (instr, path, skip) in enumerate(self.files):
+			ts, values = cache.load(path, anchor)
+			if self.start is None:
+				first, last = skip, cache.span(ts, None, self.end)[1]
+			else:
+				first, last = cache.span(ts, self.start, self.end)
+			ts, values = ts[first:last], values[first:last]
+			if not len(ts):
+				continue
+			records = np.empty(len(ts), dtype=ipc.RECORD)
+			records['chan'] = instr.chan_id
+			records['ts'] = origin + (ts - (ts[0] if self.start is None else self.start))
+			# missing readings go out as 0, as the per-file senders sent them
+			records['value'] = np.where(np.isnan(values), 0, values)
+			parts.append(records)
+			# a row stamped before the one ahead of it is sent right after it
+			keys.append(np.maximum.accumulate(records['ts']))
+		if not parts:
+			return np.zeros(0, dtype=ipc.RECORD), np.zeros(0, dtype=np.int64)
+		keys = np.concatenate(keys)
+		order = np.lexsort((np.concatenate([np.full(len(p), i) for i, p in enumerate(parts)]), keys))
+		return np.concatenate(parts)[order], keys[order]
+
+	def run(self):
+		records, keys = self.merge()
+		sent = 0
+		while sent < len(records):
+			due = self.clock.now_ns()
+			end = np.searchsorted(keys, due, side='right')
+			if end > sent:
+				self.queue.put(('batch', records[sent:end].tostring()))
+				sent = end
+			if sent < len(records):
+				self.clock.wait_until(max(keys[sent], due + self.interval))
+
+# replay FILES (from campaign_files) to QUEUE on CLOCK from datetime START to END, sending the
+# campaign's instrument list first if ANNOUNCE
+def send(queue, files, clock=None, announce=True, start=None, end=None):
+	if announce:
+		queue.put(('instruments', instruments()))
+	ReplayEngine(queue, files, clock, start=start, end=end).run()
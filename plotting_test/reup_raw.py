@@ -4,12 +4,14 @@
 import numpy as np
 import time
 import _strptime
-from datetime import datetime
+from datetime import datetime, timedelta
 import threading
 import os
 import csv
 import sys
 from multiprocessing import Process,Queue
+import replay_cache as cache
+import replay_clock as rcl
 
 class Instrument(object):
 	def __init__(self, name, v_type):
@@ -22,7 +24,11 @@ class Instrument(object):
 	def __repr__(self):
 		return self.__str__()
 
-def send(queue, filepath):
+# replay raw_data.csv from FILEPATH on CLOCK (replay_clock.ReplayClock, real time if not given) -
+# from datetime START (seeking there through replay_cache's minute index) to END if given
+def send(queue, filepath, clock=None, start=None, end=None):
+	if clock is None:
+		clock = rcl.ReplayClock()
 	instruments = []
 	# open ../instruments.csv and construct instr dict
 	instr_file = os.path.join(filepath, 'instruments.csv')
@@ -37,21 +43,25 @@ def send(queue, filepath):
 
 	raw_data_path = os.path.join(filepath, 'raw_data.csv')
 	with open(raw_data_path) as csv_file:
+		csv_file.readline()
+		if start is not None:
+			cache.seek(csv_file, raw_data_path, cache.recording_ns(start))
 		csv_reader = csv.reader(csv_file, delimiter=',')
-		next(csv_reader)
-		first_item = next(csv_reader)
-		actual_time = datetime.strptime(first_item[0], '%Y-%m-%d %H:%M:%S.%f')
-		currpost_value = float(first_item[3])
-		first_post = ([first_item[1], first_item[2]], [currpost_value, datetime.now()])
-		queue.put(first_post)
+		first_time = start
 		for item in csv_reader:
 			local_time = datetime.strptime(item[0], '%Y-%m-%d %H:%M:%S.%f')
-			sleep_time = (local_time - actual_time).total_seconds()
-			time.sleep((local_time - actual_time).total_seconds())
-			actual_time = local_time
+			if start is not None and local_time < start:
+				continue
+			if end is not None and local_time >= end:
+				break
+			if first_time is None:
+				first_time = local_time
+			# stamped with its recording time mapped onto the replay clock, sent once the clock gets there
+			ts = clock.at(local_time - first_time)
+			clock.wait_until(ts)
 			try:
 				local_value = float(item[3])
 			except ValueError:
 				local_value = 0
-			post = ([item[1], item[2]], [currpost_value, datetime.now()])
-			queue.put(post)
\ No newline at end of file
+			post = ([item[1], item[2]], [local_value, ts])
+			queue.put(post)
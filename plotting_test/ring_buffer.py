@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import ctypes
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+import ipc_batch as ipc
+
+# header slots
+WRITE_CURSOR = 0
+READ_CURSOR = 1
+OVERWRITTEN = 2
+
+# lock-free single-producer / single-consumer ring of ipc.RECORDs in shared memory
+#
+# the memory is allocated before the acquisition process is forked, so producer and
+# consumer map the same pages. the producer writes a record and then advances the write
+# cursor; the consumer keeps its own read cursor and gets numpy views straight onto the
+# shared records. cursors only ever increase, slot = cursor % capacity.
+#
+# overruns are counted on both sides - OVERWRITTEN by the producer when it writes over a
+# record the consumer hasn't read yet, lost by the consumer for records it never saw
+class RingBuffer(object):
+
+	def __init__(self, capacity=8192):
+		self.capacity = capacity
+		self.raw_header = RawArray(ctypes.c_int64, 3)
+		self.raw_records = RawArray(ctypes.c_char, capacity * ipc.RECORD.itemsize)
+		self.header = np.frombuffer(self.raw_header, dtype=np.int64)
+		self.records = np.frombuffer(self.raw_records, dtype=ipc.RECORD)
+		self.cursor = 0
+		self.lost = 0
+
+	# producer side
+	def write(self, chan, ts, value):
+		w = int(self.header[WRITE_CURSOR])
+		if w - int(self.header[READ_CURSOR]) >= self.capacity:
+			self.header[OVERWRITTEN] += 1
+		self.records[w % self.capacity] = (chan, ts, value)
+		self.header[WRITE_CURSOR] = w + 1
+
+	# consumer side - returns a list of zero-copy views (two when the new records wrap
+	# around the end of the ring) covering everything written since the last read.
+	# the views are only valid until the producer laps them, so consume them straight away
+	def read(self):
+		w = int(self.header[WRITE_CURSOR])
+		r = self.cursor
+		if w - r > self.capacity:
+			self.lost += w - r - self.capacity
+			r = w - self.capacity
+		self.cursor = w
+		self.header[READ_CURSOR] = w
+		if r == w:
+			return []
+		start = r % self.capacity
+		stop = start + (w - r)
+		if stop <= self.capacity:
+			return [self.records[start:stop]]
+		return [self.records[start:], self.records[:stop - self.capacity]]
+
+	def overruns(self):
+		return {'overwritten': int(self.header[OVERWRITTEN]), 'lost': self.lost}
+
+# one ring per acquisition channel, allocated up front by the plotter before it starts
+# the acquisition process - channel ids beyond SLOTS can't use the ring transport
+class RingPool(object):
+
+	def __init__(self, slots=16, capacity=8192):
+		self.rings = [RingBuffer(capacity) for i in range(slots)]
+
+	def __len__(self):
+		return len(self.rings)
+
+	def __getitem__(self, chan):
+		return self.rings[chan]
+
+	def overruns(self):
+		return dict((chan, ring.overruns()) for chan, ring in enumerate(self.rings))
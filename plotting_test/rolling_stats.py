@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import bisect
+
+# slides between refreshing the running sums from the values, so rounding can't build up
+RESUM = 1000
+
+# mean, variance and order statistics of the values in a sliding window of int seconds
+#
+# the window is moved on with slide(start, stop, value), value(second) giving the value of a
+# second coming into it (None if it has none). seconds going out and coming in are taken off or
+# added to a running sum, sum of squares and a sorted list (bisect), so moving on by a second
+# is O(log n) rather than re-summing and re-sorting the whole window - any width, e.g. the 60 s
+# guessing window or the 180 s the analysis keeps. moving it back, or on past its end, refills it.
+class RollingWindow(object):
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.start = None
+        self.stop = None
+        # second -> value, for the seconds in the window with one
+        self.values = {}
+        self.sorted = []
+        self.sum = 0.0
+        self.sumsq = 0.0
+        self.slides = 0
+
+    def _add(self, second, value):
+        self.values[second] = value
+        bisect.insort(self.sorted, value)
+        self.sum += value
+        self.sumsq += value * value
+
+    def _remove(self, second):
+        value = self.values.pop(second)
+        del self.sorted[bisect.bisect_left(self.sorted, value)]
+        self.sum -= value
+        self.sumsq -= value * value
+
+    # move the window to seconds START to STOP (exclusive)
+    def slide(self, start, stop, value):
+        if self.start is None or start < self.start or stop < self.stop or start >= self.stop:
+            self.clear()
+            self.start = self.stop = start
+        for t in range(self.start, start):
+            if t in self.values:
+                self._remove(t)
+        for t in range(self.stop, stop):
+            v = value(t)
+            if v is not None:
+                self._add(t, v)
+        self.start, self.stop = start, stop
+        self.slides += 1
+        if self.slides % RESUM == 0:
+            self.sum = sum(self.sorted)
+            self.sumsq = sum(v * v for v in self.sorted)
+
+    # SECOND's value changed to VALUE (None if it has none) - e.g. a late reading
+    def update(self, second, value):
+        if self.start is None or not self.start <= second < self.stop:
+            return
+        if second in self.values:
+            self._remove(second)
+        if value is not None:
+            self._add(second, value)
+
+    def mean(self):
+        if not self.sorted:
+            return None
+        return self.sum / len(self.sorted)
+
+    # population variance
+    def variance(self):
+        if not self.sorted:
+            return None
+        mean = self.mean()
+        return max(self.sumsq / len(self.sorted) - mean * mean, 0.0)
+
+    # I-th lowest value, None if there are no more than I
+    def lowest(self, i):
+        if i >= len(self.sorted):
+            return None
+        return self.sorted[i]
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import numpy as np
+
+# per-second flags
+GUESSED = 1     # plume guessed for the second - PLUME holds the guess
+PLUME = 2
+BLIP = 4        # deblipping done
+WRITTEN = 8     # written to secondly_data.csv
+ANALYZED = 16   # plume ending at the second analysed
+
+# seconds held - comfortably more than the 185 s the analysis keeps
+CAPACITY = 512
+
+# species in secondly_data.csv column order
+SPECIES = ('CO2', 'NOX', 'BC')
+
+# readings aligned to int epoch seconds, for the plume analysis
+#
+# a fixed ring of CAPACITY second slots, slot = second % CAPACITY. per slot it keeps the sum and
+# count of the readings of every channel of each species (one column per channel) and the
+# analysis flags, so adding a reading and averaging a second are array lookups, and a range of
+# seconds is a slice. a slot holds a second once a reading for it arrives, until it is evicted
+# or the ring comes round to it again - looking up a second that isn't held raises KeyError.
+#
+# alongside, every channel's last value is carried forward as readings come in: per slot, the
+# latest second up to the slot's with a reading of the channel, and its mean. gaps are filled
+# when the next reading arrives, and a late reading refills the seconds up to the next one, so
+# last() is a single lookup and last_range() a slice, for any second of the last CAPACITY.
+class SecondStore(object):
+
+    def __init__(self, chans, capacity=CAPACITY):
+        self.capacity = capacity
+        # second held by each slot, -1 if none
+        self.second = np.full(capacity, -1, dtype=np.int64)
+        self.flags = np.zeros(capacity, dtype=np.uint8)
+        # species -> (capacity, channels) arrays
+        self.sums = {}
+        self.counts = {}
+        # species -> (capacity, channels) last second with a reading (-1 if none yet) and its mean
+        self.last_second = {}
+        self.last_value = {}
+        # species -> channels array of the newest second with a reading (-1 if none yet)
+        self.newest = {}
+        for species, n in chans.items():
+            self.sums[species] = np.zeros((capacity, n))
+            self.counts[species] = np.zeros((capacity, n), dtype=np.int32)
+            self.last_second[species] = np.full((capacity, n), -1, dtype=np.int64)
+            self.last_value[species] = np.zeros((capacity, n))
+            self.newest[species] = np.full(n, -1, dtype=np.int64)
+        # seconds held, and the first of them since the store was last empty
+        self.held = 0
+        self.first = None
+        # readings too old for the ring
+        self.dropped = 0
+
+    def __contains__(self, second):
+        return self.second[second % self.capacity] == second
+
+    def slot(self, second):
+        slot = second % self.capacity
+        if self.second[slot] != second:
+            raise KeyError(second)
+        return slot
+
+    # reading VALUE of channel CHAN of SPECIES in int epoch second SECOND - returns True if it is
+    # the first reading of the second
+    def add(self, second, species, chan, value):
+        slot = second % self.capacity
+        held = self.second[slot]
+        new = bool(held != second)
+        if new:
+            if held > second:
+                # the ring has moved on past it
+                self.dropped += 1
+                return False
+            if held < 0:
+                if not self.held:
+                    self.first = second
+                self.held += 1
+            self.second[slot] = second
+            self.flags[slot] = 0
+            for s in self.sums:
+                self.sums[s][slot] = 0
+                self.counts[s][slot] = 0
+        self.sums[species][slot, chan] += value
+        self.counts[species][slot, chan] += 1
+        self.carry(second, species, chan, self.sums[species][slot, chan] / self.counts[species][slot, chan])
+        return new
+
+    # carry the mean MEAN of channel CHAN of SPECIES in SECOND forward
+    def carry(self, second, species, chan, mean):
+        last_second = self.last_second[species]
+        last_value = self.last_value[species]
+        newest = self.newest[species][chan]
+        if second >= newest:
+            if newest >= 0 and second > newest + 1:
+                # the gap since the newest reading
+                gap = np.arange(max(newest + 1, second - self.capacity + 1), second) % self.capacity
+                last_second[gap, chan] = newest
+                last_value[gap, chan] = last_value[newest % self.capacity, chan]
+            last_second[second % self.capacity, chan] = second
+            last_value[second % self.capacity, chan] = mean
+            self.newest[species][chan] = second
+        elif second > newest - self.capacity:
+            # a late reading - the seconds after it up to the next one with a reading
+            slots = np.arange(second, newest + 1) % self.capacity
+            slots = slots[last_second[slots, chan] <= second]
+            last_second[slots, chan] = second
+            last_value[slots, chan] = mean
+
+    # add a column for a new channel of SPECIES
+    def add_channel(self, species):
+        self.sums[species] = np.hstack([self.sums[species], np.zeros((self.capacity, 1))])
+        self.counts[species] = np.hstack([self.counts[species], np.zeros((self.capacity, 1), dtype=np.int32)])
+        self.last_second[species] = np.hstack([self.last_second[species], np.full((self.capacity, 1), -1, dtype=np.int64)])
+        self.last_value[species] = np.hstack([self.last_value[species], np.zeros((self.capacity, 1))])
+        self.newest[species] = np.append(self.newest[species], -1)
+
+    def evict(self, second):
+        slot = self.slot(second)
+        self.second[slot] = -1
+        self.held -= 1
+
+    # (seconds, flags) arrays of the seconds held from START to STOP (inclusive), in order
+    def seconds(self, start, stop):
+        seconds = np.arange(max(start, stop - self.capacity + 1), stop + 1)
+        slots = seconds % self.capacity
+        held = self.second[slots] == seconds
+        return seconds[held], self.flags[slots[held]]
+
+    # mean reading of channel CHAN of SPECIES in SECOND, None if it has none
+    def mean(self, second, species, chan):
+        slot = self.slot(second)
+        count = self.counts[species][slot, chan]
+        if not count:
+            return None
+        return float(self.sums[species][slot, chan]) / int(count)
+
+    # means of every channel in SECOND, in SPECIES order - None for a channel without readings
+    def row(self, second):
+        slot = self.slot(second)
+        row = []
+        for species in SPECIES:
+            counts = self.counts[species][slot]
+            means = self.sums[species][slot] / np.maximum(counts, 1)
+            row += [m if c else None for m, c in zip(means.tolist(), counts.tolist())]
+        return row
+
+    # (value, age) of channel CHAN of SPECIES at SECOND - the mean of the latest second at or before
+    # it with a reading, and how many seconds before it that was. (None, None) if there is none
+    def last(self, second, species, chan):
+        newest = self.newest[species][chan]
+        if newest < 0 or second <= newest - self.capacity:
+            return None, None
+        slot = min(second, newest) % self.capacity
+        last = self.last_second[species][slot, chan]
+        if last < 0 or last > second:
+            return None, None
+        return float(self.last_value[species][slot, chan]), int(second - last)
+
+    # (values, ages) arrays of last() for seconds START to STOP (inclusive) - NaN and -1 where
+    # there is none. for every channel of SPECIES, one column each, if CHAN is None
+    def last_range(self, start, stop, species, chan=None):
+        seconds = np.arange(start, stop + 1)[:, None]
+        chans = np.arange(len(self.newest[species])) if chan is None else np.array([chan])
+        newest = self.newest[species][chans]
+        slots = np.minimum(seconds, newest) % self.capacity
+        last = self.last_second[species][slots, chans]
+        none = (newest < 0) | (seconds <= newest - self.capacity) | (last < 0) | (last > seconds)
+        values = np.where(none, np.nan, self.last_value[species][slots, chans])
+        ages = np.where(none, -1, seconds - last)
+        if chan is not None:
+            return values[:, 0], ages[:, 0]
+        return values, ages
+
+    def flag(self, second, flag):
+        return bool(self.flags[self.slot(second)] & flag)
+
+    def set_flag(self, second, flag, on=True):
+        slot = self.slot(second)
+        if on:
+            self.flags[slot] |= flag
+        else:
+            self.flags[slot] &= ~flag
+
+    # the plume guess for SECOND - None until it has been guessed
+    def plume(self, second):
+        flags = self.flags[self.slot(second)]
+        if not flags & GUESSED:
+            return None
+        return bool(flags & PLUME)
+
+    def set_plume(self, second, plume):
+        self.set_flag(second, GUESSED)
+        self.set_flag(second, PLUME, plume)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import os
+import sys
+import tty
+import time
+import math
+import errno
+import fcntl
+import random
+import select
+import signal
+import struct
+from argparse import ArgumentParser
+import data_ac as d_ac
+
+# simulated instruments for running data_ac.py without the hardware
+#
+# one pseudo-terminal per instrument type in data_ac.comport_dict, linked into DIRECTORY under the
+# name data_ac discovers it by (cu.usbserial-<sn>, cu.wchusbserial<sn> for the ABCD). streaming
+# instruments write a line every INTERVAL/RATE seconds laid out exactly as their LineParser reads
+# it, the K30, UCB and Vaisala answer the requests the poll scheduler sends. readings follow a
+# noisy baseline with a plume every PLUME_PERIOD seconds so the analysis has something to find.
+#
+#   python sim_farm.py /tmp/plumerator-sim --rate 10
+#   python cli.py -i -d /tmp/plumerator-sim
+
+PLUME_PERIOD = 60
+PLUME_LENGTH = 12
+
+# name -> seconds between lines at real rate (None = only answers requests), baseline, plume height
+PROFILES = {
+	'AE33': (1.0, 2000.0, 40000.0),
+	'AE16': (1.0, 2000.0, 40000.0),
+	'ABCD': (1.0, 2.0, 40.0),
+	'MA300': (1.0, 2000.0, 40000.0),
+	'LI7000': (0.5, 410.0, 800.0),
+	'LI820': (0.5, 410.0, 800.0),
+	'SBA5': (1.0, 410.0, 800.0),
+	'Vaisala': (None, 410.0, 800.0),
+	'K30': (None, 410.0, 800.0),
+	'UCB': (None, 0.02, 1.5),
+	'CAPS': (1.0, 20.0, 1500.0),
+}
+
+# one simulated instrument on the master side of a pty
+class SimInstrument(object):
+
+	def __init__(self, name, link, interval, baseline, height):
+		self.name = name
+		self.link = link
+		self.interval = interval
+		self.baseline = baseline
+		self.height = height
+		self.master, slave = os.openpty()
+		# no echo or newline translation before the acquisition side opens the port
+		tty.setraw(slave)
+		# keep the slave open so the master doesn't see EIO while the port is closed
+		self.slave = slave
+		flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
+		fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+		if os.path.lexists(link):
+			os.remove(link)
+		os.symlink(os.ttyname(slave), link)
+		self.request = ''
+		self.streaming = interval is not None
+		self.next = time.time()
+		self.lines = 0
+		self.dropped = 0
+
+	# current reading - baseline noise plus a plume every PLUME_PERIOD seconds
+	def value(self, now):
+		phase = now % PLUME_PERIOD
+		v = self.baseline * (1 + random.gauss(0, 0.01))
+		if phase < PLUME_LENGTH:
+			v += self.height * math.sin(math.pi * phase / PLUME_LENGTH)
+		return v
+
+	def write(self, data):
+		try:
+			os.write(self.master, data)
+			self.lines += 1
+		except OSError as e:
+			# nobody is reading the port and the pty buffer is full
+			if e.errno not in (errno.EAGAIN, errno.EIO):
+				raise
+			self.dropped += 1
+
+	# answer whatever request bytes arrived on the port
+	def handle_request(self):
+		try:
+			data = os.read(self.master, 256)
+		except OSError:
+			return
+		self.request += data
+		if self.name == 'K30':
+			while len(self.request) >= 7:
+				self.request = self.request[7:]
+				co2 = int(self.value(time.time()))
+				self.write(struct.pack('>BBBH', 0xFE, 0x44, 0x02, co2 & 0xFFFF) + '\x00\x00')
+		elif self.name == 'UCB':
+			while '\x03' in self.request:
+				# ETX plus the checksum byte that follows it
+				end = self.request.index('\x03') + 2
+				if len(self.request) < end:
+					break
+				self.request = self.request[end:]
+				self.write(format_line(self.name, self.value(time.time())))
+		elif self.name == 'Vaisala':
+			while '\n' in self.request:
+				cmd, self.request = self.request.split('\n', 1)
+				cmd = cmd.strip()
+				if cmd == 'R':
+					self.streaming = True
+					self.interval = 1.0
+					self.next = time.time()
+				self.write(format_line(self.name, self.value(time.time())))
+		else:
+			self.request = ''
+
+	def close(self):
+		for fd in (self.master, self.slave):
+			try:
+				os.close(fd)
+			except OSError:
+				pass
+		if os.path.lexists(self.link):
+			os.remove(self.link)
+
+def fill(n):
+	return ['0'] * n
+
+# one line of NAME's serial output carrying the primary reading V, laid out field for field
+# where data_ac's parser for that instrument reads it
+def format_line(name, v):
+	if name == 'AE33':
+		# ',' - bc (ng/m3) at 9, flow at 10
+		fields = [time.strftime('%Y/%m/%d'), time.strftime('%H:%M:%S')] + fill(7) + ['%d' % v, '5000', '1', '0']
+		return ','.join(fields) + '\r\n'
+	if name == 'AE16':
+		# ',' - bc (ng/m3) at 2, flow at 3, attn at 9
+		fields = ['"%s"' % time.strftime('%d-%b-%y').lower(), '"%s"' % time.strftime('%H:%M'), '%d' % v, '4.9'] + fill(5) + ['%.3f' % random.uniform(5, 60)]
+		return ','.join(fields) + '\r\n'
+	if name == 'ABCD':
+		# ',' - attn at 3, bc at 4, flow at 7
+		fields = [time.strftime('%H:%M:%S'), '0', '0', '%.2f' % random.uniform(5, 60), '%.3f' % v, '0', '0', '0.150', '0']
+		return ','.join(fields) + '\r\n'
+	if name == 'MA300':
+		# ',' - flow at 4, attn at 9, bc (ng/m3) at 44
+		fields = fill(45)
+		fields[0] = time.strftime('%Y/%m/%d %H:%M:%S')
+		fields[4] = '150'
+		fields[9] = '%.3f' % random.uniform(5, 60)
+		fields[44] = '%d' % v
+		return ','.join(fields) + '\r\n'
+	if name == 'LI7000':
+		# '\t' - co2 at 8, pressure at 21, temp at 24
+		fields = fill(25)
+		fields[0] = time.strftime('%H:%M:%S')
+		fields[8] = '%.3f' % v
+		fields[21] = '101.3'
+		fields[24] = '50.1'
+		return '\t'.join(fields) + '\n'
+	if name == 'LI820':
+		# tags - celltemp, cellpres, co2 at 6, 10 and 14 once both tag brackets are split on
+		return '<li820><data><celltemp>5.11e1</celltemp><cellpres>1.013e2</cellpres><co2>%.4e</co2><co2abs>7.1e-2</co2abs></data></li820>\n' % v
+	if name == 'SBA5':
+		# ' ' - co2 at 3, temp at 4, pressure (mbar) at 7
+		return 'M 50123 48210 %.0f 55.0 0.0 0.0 1013 14 0\r\n' % v
+	if name == 'Vaisala':
+		# '\t' - co2, temp
+		return '%.1f\t25.0\r\n' % v
+	if name == 'UCB':
+		# ',' - nox at 1
+		return '01RD0,%.4f\r\n' % v
+	if name == 'CAPS':
+		# ',' - nox (ppt) at 1
+		return '+0.000,%.1f,0,0,0\r\n' % v
+	raise ValueError('no line format for %s' % name)
+
+# one SimInstrument per instrument type in data_ac.comport_dict, linked into DIRECTORY
+class SimFarm(object):
+
+	def __init__(self, directory, rate=1.0, names=None):
+		self.directory = os.path.abspath(directory)
+		if not os.path.exists(self.directory):
+			os.makedirs(self.directory)
+		self.rate = rate
+		self.instruments = []
+		seen = set()
+		for sn, cls in sorted(d_ac.comport_dict.items()):
+			# the Vaisala is listed by serial number as well as without one
+			if cls in seen or sn == 'Vaisala':
+				continue
+			seen.add(cls)
+			name = cls.__name__.split('_')[0]
+			if name == 'VCO2':
+				name = 'Vaisala'
+			if names and name not in names:
+				continue
+			if sn == 'wchusbserial':
+				link = os.path.join(self.directory, 'cu.wchusbserial1410')
+			else:
+				link = os.path.join(self.directory, 'cu.usbserial-' + sn)
+			interval, baseline, height = PROFILES[name]
+			if interval is not None:
+				interval = interval / rate
+			self.instruments.append(SimInstrument(name, link, interval, baseline, height))
+
+	# stream and answer requests until STOP() returns True
+	def run(self, stop, report_interval=10):
+		last_report = time.time()
+		masters = dict((sim.master, sim) for sim in self.instruments)
+		while not stop():
+			now = time.time()
+			due = [sim.next for sim in self.instruments if sim.streaming]
+			timeout = max(min(due) - now, 0) if due else 0.2
+			try:
+				readable, _, _ = select.select(list(masters), [], [], min(timeout, 0.2))
+			except select.error:
+				continue
+			for fd in readable:
+				masters[fd].handle_request()
+			now = time.time()
+			for sim in self.instruments:
+				if sim.streaming and now >= sim.next:
+					sim.write(format_line(sim.name, sim.value(now)))
+					# keep an even cadence, but don't try to catch up after a stall
+					sim.next = max(sim.next + sim.interval, now)
+			if report_interval and now - last_report >= report_interval:
+				self.report(now - last_report)
+				last_report = now
+		for sim in self.instruments:
+			sim.close()
+
+	def report(self, elapsed):
+		for sim in self.instruments:
+			sys.stdout.write("%s: %d lines (%.1f/sec), %d dropped\n" % (sim.name, sim.lines, sim.lines / elapsed, sim.dropped))
+			sim.lines = 0
+		sys.stdout.flush()
+
+stop_requested = False
+
+def sig_handler(signum, frame):
+	global stop_requested
+	stop_requested = True
+
+if __name__ == '__main__':
+	parser = ArgumentParser()
+	parser.add_argument("directory", help="directory to link the simulated serial devices into")
+	parser.add_argument("--rate", type=float, default=1.0, help="multiple of the real instrument output rates")
+	parser.add_argument("--only", nargs='+', help="simulate only these instruments (e.g. AE33 LI820 K30)")
+	args = parser.parse_args()
+
+	signal.signal(signal.SIGTERM, sig_handler)
+	signal.signal(signal.SIGINT, sig_handler)
+
+	farm = SimFarm(args.directory, args.rate, args.only)
+	for sim in farm.instruments:
+		sys.stdout.write("%s -> %s\n" % (sim.link, os.ttyname(sim.slave)))
+	sys.stdout.flush()
+	farm.run(lambda: stop_requested)
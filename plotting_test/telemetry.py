@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import bisect
+import sys
+import timebase as tb
+
+# upper bounds (seconds) of the read latency histogram buckets - the last bucket takes the rest
+LATENCY_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0)
+# a pause between two lines of an instrument longer than this (seconds) counts as a gap
+GAP_THRESHOLD = 5.0
+
+# metrics.csv header - one row per instrument per interval
+COLUMNS = ['Timestamp', 'Instr ID', 'S#', 'Interval', 'Lines', 'Lines/sec', 'Bytes/sec', 'Failures', 'Failure Rate',
+	'Gaps', 'Longest Gap', 'Since Last Line', 'Timeouts', 'Latency Mean'] + \
+	['Latency <%gms' % (b * 1000) for b in LATENCY_BUCKETS] + ['Latency >%gms' % (LATENCY_BUCKETS[-1] * 1000)]
+
+# counters for one instrument over the current interval - plain attribute increments so they can
+# be bumped for every line
+class Metrics(object):
+
+	def __init__(self, name, sn):
+		self.name = name
+		self.sn = sn
+		# epoch ns of the last line, kept across intervals for gap detection
+		self.last_line = None
+		self.reset()
+
+	def reset(self):
+		self.lines = 0
+		self.bytes = 0
+		self.failures = 0
+		self.gaps = 0
+		self.longest_gap = 0
+		self.timeouts = 0
+		self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+		self.latency_sum = 0.0
+
+	# a line of NBYTES received at epoch ns TS, parsed if OK
+	def line(self, ts, nbytes, ok):
+		self.lines += 1
+		self.bytes += nbytes
+		if not ok:
+			self.failures += 1
+		if self.last_line is not None and ts - self.last_line > GAP_THRESHOLD * tb.NS:
+			self.gaps += 1
+			self.longest_gap = max(self.longest_gap, ts - self.last_line)
+		self.last_line = ts
+
+	# SECONDS from the data being readable (or requested) to it being published
+	def latency(self, seconds):
+		self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+		self.latency_sum += seconds
+
+	# metrics.csv row for the ELAPSED seconds up to epoch ns NOW
+	def row(self, now, elapsed):
+		latencies = sum(self.latency_counts)
+		since = (now - self.last_line) / 1e9 if self.last_line is not None else None
+		return [now, self.name, self.sn, elapsed, self.lines, self.lines / elapsed, self.bytes / elapsed, self.failures,
+			float(self.failures) / self.lines if self.lines else 0.0, self.gaps, self.longest_gap / 1e9, since,
+			self.timeouts, self.latency_sum / latencies if latencies else None] + self.latency_counts
+
+# per-instrument metrics of this process, shipped to the plotter every INTERVAL seconds as
+# ('metrics', rows) - every acquisition process has its own registry and ships only the
+# instruments it services
+class Registry(object):
+
+	def __init__(self, interval=10.0):
+		self.interval = interval
+		# chan id -> Metrics
+		self.metrics = {}
+		self.last_ship = None
+
+	def get(self, instr):
+		m = self.metrics.get(instr.chan_id)
+		if m is None:
+			m = self.metrics[instr.chan_id] = Metrics(instr.name, instr.serial_num)
+		return m
+
+	def remove(self, instr):
+		self.metrics.pop(instr.chan_id, None)
+
+	# rows for every instrument since the last snapshot, starting a new interval
+	def snapshot(self, elapsed):
+		now = tb.now_ns()
+		rows = []
+		for chan, m in sorted(self.metrics.items()):
+			rows.append(m.row(now, elapsed))
+			m.reset()
+		return rows
+
+	# ship a snapshot to QUEUE if INTERVAL seconds have passed - cheap enough to call every loop
+	def poll(self, queue):
+		now = tb.monotonic_ns() / 1e9
+		if self.last_ship is None:
+			self.last_ship = now
+		elif now - self.last_ship >= self.interval:
+			rows = self.snapshot(now - self.last_ship)
+			self.last_ship = now
+			if rows:
+				queue.put(('metrics', rows))
+				report(rows)
+
+# the metrics registry of this process
+registry = Registry()
+
+# print the instruments that failed to parse or went quiet during the interval
+def report(rows):
+	for row in rows:
+		failures, gaps, since = row[7], row[9], row[11]
+		if failures or gaps or (since is not None and since > GAP_THRESHOLD):
+			sys.stdout.write("%s S#-%s: %d lines, %d parse failures, %d gaps, last line %.1fs ago\n" % (row[1], row[2], row[4], failures, gaps, since or 0))
+	sys.stdout.flush()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+import ctypes
+import ctypes.util
+import sys
+import time
+from datetime import datetime, timedelta
+
+# integer epoch-nanosecond timebase used throughout the pipeline
+#
+# readings are stamped with now_ns() - a monotonic clock anchored to wall time once per
+# process tree, so timestamps never jump backwards when the system clock is adjusted.
+# analysis works on int seconds (ns // NS); datetimes are only built for csv output
+
+NS = 1000000000
+
+class _timespec(ctypes.Structure):
+	_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+# pick the best monotonic nanosecond clock available on this platform
+def _monotonic_source():
+	if hasattr(time, 'monotonic'):
+		return lambda: int(time.monotonic() * NS)
+	try:
+		if sys.platform == 'darwin':
+			libc = ctypes.CDLL(ctypes.util.find_library('c'))
+			class _timebase_info(ctypes.Structure):
+				_fields_ = [('numer', ctypes.c_uint32), ('denom', ctypes.c_uint32)]
+			info = _timebase_info()
+			libc.mach_timebase_info(ctypes.byref(info))
+			libc.mach_absolute_time.restype = ctypes.c_uint64
+			numer, denom = info.numer, info.denom
+			return lambda: libc.mach_absolute_time() * numer // denom
+		else:
+			librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno=True)
+			CLOCK_MONOTONIC = 1
+			# a timespec per call - ctypes releases the gil around clock_gettime, so a shared one
+			# could be filled by two threads at once
+			def clock():
+				ts = _timespec()
+				librt.clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts))
+				return ts.tv_sec * NS + ts.tv_nsec
+			clock()
+			return clock
+	except (OSError, AttributeError, TypeError):
+		return lambda: int(time.time() * NS)
+
+monotonic_ns = _monotonic_source()
+
+# wall-clock anchor - forked processes inherit it, so every process agrees on the mapping
+_anchor_wall = int(time.time() * NS)
+_anchor_mono = monotonic_ns()
+
+# current time in epoch nanoseconds, from the anchored monotonic clock
+def now_ns():
+	return _anchor_wall + (monotonic_ns() - _anchor_mono)
+
+# floor epoch nanoseconds NS_TS to an int epoch second
+def floor_s(ns_ts):
+	return ns_ts // NS
+
+# local naive datetime for epoch nanoseconds NS_TS - only for writing csv files
+def to_datetime(ns_ts):
+	ns_ts = int(ns_ts)
+	return datetime.fromtimestamp(ns_ts // NS) + timedelta(microseconds=(ns_ts % NS) // 1000)
+
+# epoch nanoseconds for a local naive datetime DT
+def from_datetime(dt):
+	return int(time.mktime(dt.timetuple())) * NS + dt.microsecond * 1000